@@ -1,14 +1,15 @@
 import streamlit as st
-import asyncio
+import time
 import json
 import logging
 from typing import Dict, Any
 
-# Import your existing modules
-from src.pricing import classify_pricing, get_pricing_from_instagram
-from src.services.rapidapi import get_instagram_page_info, get_instagram_post_info
-from src.agents import analyze_asset
-from src.utils import create_collage_from_urls
+# Import your existing modules; RapidAPI, OpenAI and image code load in the analysis job
+from src.pricing import classify_pricing
+from src.jobs import JobQueue, Job
+from src.batch import profile_key
+from src.tracing import span, collect_spans, summarize_spans
+from src.usage import track_usage
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -181,6 +182,10 @@ def format_list(items, max_items=5, separator=", "):
 
 async def analyze_instagram_profile(url: str, progress_bar, status_text):
     """Analyze Instagram profile and return pricing information"""
+    from src.services.rapidapi import get_instagram_page_info, get_instagram_post_info, extract_thumbnail_urls
+    from src.agents import analyze_asset
+    from src.utils import create_collage_from_urls, select_distinct_thumbnails, THUMBNAIL_BACKFILL_POSTS
+
     try:
         # Update progress
         progress_bar.progress(10)
@@ -195,11 +200,15 @@ async def analyze_instagram_profile(url: str, progress_bar, status_text):
         progress_bar.progress(30)
         status_text.text("📊 Analyzing posts and engagement...")
         
-        # Get posts for engagement calculation
-        posts, _ = await get_instagram_post_info(
+        # Get posts for engagement calculation, plus extras to backfill duplicate thumbnails
+        candidate_posts, _ = await get_instagram_post_info(
             page_info["platform_specific_info"]["pk"], 
-            n_posts=27
+            n_posts=27 + THUMBNAIL_BACKFILL_POSTS,
+            exact=True,
+            keep_raw=False,
+            slim=True,
         )
+        posts = candidate_posts[:27]
         
         if not posts:
             return {"error": "No posts found for analysis"}
@@ -215,14 +224,9 @@ async def analyze_instagram_profile(url: str, progress_bar, status_text):
         ])
         engagement_rate = (total_engagement / len(posts) / follower_count) * 100
         
-        # Extract image URLs for content analysis
-        image_urls = []
-        for post in posts[:27]:  # Limit to 27 posts
-            if post.get("media_list"):
-                for media in post["media_list"]:
-                    if media.get('type') in ['thumbnail', 'image'] and media.get('url'):
-                        image_urls.append(media.get('url'))
-                        break
+        # Extract image URLs for content analysis, dropping near-duplicates (max 27)
+        contents = {}
+        image_urls = await select_distinct_thumbnails(extract_thumbnail_urls(candidate_posts), limit=27, contents=contents)
         
         progress_bar.progress(70)
         status_text.text("🤖 Analyzing content quality...")
@@ -230,12 +234,13 @@ async def analyze_instagram_profile(url: str, progress_bar, status_text):
         # Create collages for AI analysis
         collages = []
         if image_urls:
-            for i in range(0, min(len(image_urls), 27), 9):
+            for i in range(0, len(image_urls), 9):
                 try:
                     collage = await create_collage_from_urls(
                         image_urls[i:i+9],
                         width=900,
-                        height=900
+                        height=900,
+                        contents=contents,
                     )
                     collages.append(collage)
                 except Exception as e:
@@ -251,7 +256,7 @@ async def analyze_instagram_profile(url: str, progress_bar, status_text):
             try:
                 analysis = await analyze_asset(page_name,collages)
                 if "pricing" in analysis:
-                    content_category = analysis["pricing"].get("category", "general")
+                    content_category = analysis["pricing"].get("category") or "general"
             except Exception as e:
                 logging.warning(f"Classification failed: {e}")
         
@@ -259,7 +264,8 @@ async def analyze_instagram_profile(url: str, progress_bar, status_text):
         status_text.text("💰 Calculating pricing...")
         
         # Get pricing classification
-        pricing = classify_pricing(follower_count, engagement_rate, content_category)
+        with span("pricing.classify", content_type=content_category):
+            pricing = classify_pricing(follower_count, engagement_rate, content_category)
         
         # Compile results
         result = {
@@ -279,6 +285,33 @@ async def analyze_instagram_profile(url: str, progress_bar, status_text):
     except Exception as e:
         return {"error": f"Analysis failed: {str(e)}"}
 
+
+async def run_analysis(progress, url: str):
+    """Job runner: the job's progress sink stands in for the progress bar and status text"""
+    with collect_spans() as spans, track_usage() as usage:
+        result = await analyze_instagram_profile(url, progress, progress)
+    result["trace_summary"] = summarize_spans(spans)
+    result["usage"] = usage.summary()
+    return result
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    """One background job queue shared by every session of the app"""
+    return JobQueue(run_analysis)
+
+
+def wait_for_job(job: Job, progress_bar, status_text, poll_interval: float = 0.5):
+    """Mirror a job's progress into the UI until it finishes"""
+    queue = get_job_queue()
+    while not job.finished:
+        progress_bar.progress(job.progress)
+        if job.status == "queued":
+            status_text.text(f"⏳ Waiting in queue ({queue.position(job)} ahead)...")
+        else:
+            status_text.text(job.message)
+        time.sleep(poll_interval)
+
 def main():
     # Header with better styling
     st.markdown("# 📊 Instagram Pricing Analyzer")
@@ -302,25 +335,34 @@ def main():
         elif "instagram.com" not in url:
             st.error("Please enter a valid Instagram URL")
         else:
-            # Create progress indicators
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            # Run analysis
-            with st.spinner("Analyzing profile..."):
-                result = asyncio.run(analyze_instagram_profile(url, progress_bar, status_text))
-            
-            # Clear progress indicators
-            progress_bar.empty()
-            status_text.empty()
-            
-            # Display results
-            if "error" in result:
-                st.error(f"❌ {result['error']}")
-            else:
-                st.session_state.analysis_result = result
-                st.success("✅ Analysis completed successfully!")
-                st.rerun()
+            # Queue the analysis; a rerun keeps polling the same job
+            job = get_job_queue().submit(profile_key(url), url)
+            st.session_state.job_id = job.id
+
+    job = get_job_queue().get(st.session_state.job_id) if st.session_state.get("job_id") else None
+    if job is not None:
+        # Create progress indicators
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+
+        # Wait for the background job
+        with st.spinner("Analyzing profile..."):
+            wait_for_job(job, progress_bar, status_text)
+        del st.session_state.job_id
+
+        # Clear progress indicators
+        progress_bar.empty()
+        status_text.empty()
+
+        result = job.result if job.status == "done" else {"error": f"Analysis failed: {job.error}"}
+
+        # Display results
+        if "error" in result:
+            st.error(f"❌ {result['error']}")
+        else:
+            st.session_state.analysis_result = result
+            st.success("✅ Analysis completed successfully!")
+            st.rerun()
     
         # Display results if available
     if hasattr(st.session_state, 'analysis_result') and st.session_state.analysis_result:
@@ -460,6 +502,28 @@ def main():
             
             st.markdown('</div>', unsafe_allow_html=True)
         
+        # Where the time went: one row per traced stage
+        trace_summary = result.get("trace_summary")
+        if trace_summary:
+            st.markdown("---")
+            with st.expander("⏱️ Performance Trace"):
+                st.dataframe(trace_summary, use_container_width=True, hide_index=True)
+
+        usage = result.get("usage")
+        if usage and (usage["total"]["calls"] or usage["total"]["cache_hits"]):
+            with st.expander("💵 LLM Usage & Cost"):
+                total = usage["total"]
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Cost", f"${total['cost_usd']:.4f}")
+                col2.metric("Tokens", f"{total['input_tokens'] + total['output_tokens']:,}")
+                col3.metric("Calls (cache hits)", f"{total['calls']} ({total['cache_hits']})")
+                st.dataframe(
+                    [{"schema": schema} | row for schema, row in usage["by_schema"].items()],
+                    use_container_width=True, hide_index=True,
+                )
+                if usage.get("unpriced_models"):
+                    st.caption(f"No price configured for: {', '.join(usage['unpriced_models'])}")
+
         # Reset button with better styling
         st.markdown("---")
         col1, col2, col3 = st.columns([1, 2, 1])
@@ -1,80 +1,316 @@
 from typing import List, Dict, Any
+import os
 import json
 import logging
 import asyncio
 
-from src.clients import openai_response
-from src.prompts import CATEGORIZE_PROMPT, BASE_PROMPT_TEMPLATE, LANGUAGE_SCHEMA, LOCATION_SCHEMA, TARGET_DEMOGRAPHICS_SCHEMA, CATEGORIZATION_TAGS_SCHEMA, CONTENT_TAGS_SCHEMA,PROFESSIONAL_ATTRIBUTES_SCHEMA, BRAND_ELEMENTS_SCHEMA
+from src.clients import openai_response, encode_images, EncodedImage, ImagePolicy
+from src.prompts import CATEGORIZE_PROMPT, BASE_PROMPT_TEMPLATE, COMBINED_PROMPT_TEMPLATE, COMBINED_SECTION_TEMPLATE, LANGUAGE_SCHEMA, LOCATION_SCHEMA, TARGET_DEMOGRAPHICS_SCHEMA, CATEGORIZATION_TAGS_SCHEMA, CONTENT_TAGS_SCHEMA,PROFESSIONAL_ATTRIBUTES_SCHEMA, BRAND_ELEMENTS_SCHEMA
+from src.prompts import CATEGORIZE_JSON_SCHEMA, LANGUAGE_JSON_SCHEMA, LOCATION_JSON_SCHEMA, TARGET_DEMOGRAPHICS_JSON_SCHEMA, CATEGORIZATION_TAGS_JSON_SCHEMA, CONTENT_TAGS_JSON_SCHEMA, PROFESSIONAL_ATTRIBUTES_JSON_SCHEMA, BRAND_ELEMENTS_JSON_SCHEMA
 from src.utils import extract_x
+from src.cache import SQLiteCache, make_cache_key
+from src.tracing import span
+from src.usage import record_cache_hit
+from src.settings import load_env
+
+ANALYSIS_MODEL = "gpt-4.1-mini"
+
+load_env()
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+llm_cache = SQLiteCache(
+    path=os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite"),
+    ttl=float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600))),
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000")),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+)
+
+# Constrain responses to the JSON schemas in RESPONSE_SCHEMAS (structured outputs)
+STRUCTURED_OUTPUTS = os.getenv("STRUCTURED_OUTPUTS", "true").lower() in ("1", "true", "yes")
+# Extra requests for a schema whose response could not be parsed
+SCHEMA_REPAIR_ATTEMPTS = int(os.getenv("SCHEMA_REPAIR_ATTEMPTS", "1"))
+
+CATEGORIES_TO_ANALYZE = {
+    "pricing": CATEGORIZE_PROMPT,
+    "language": LANGUAGE_SCHEMA,
+    "location": LOCATION_SCHEMA,
+    "target_demographics": TARGET_DEMOGRAPHICS_SCHEMA,
+    "categorization_tags": CATEGORIZATION_TAGS_SCHEMA,
+    "content_tags": CONTENT_TAGS_SCHEMA,
+    "professional_attributes": PROFESSIONAL_ATTRIBUTES_SCHEMA,
+    "brand_elements": BRAND_ELEMENTS_SCHEMA,
+}
+
+# Image detail per schema; unlisted schemas use the image policy's detail.
+# Language and location read large text and flags, which survive low detail.
+SCHEMA_IMAGE_DETAIL = {
+    "pricing": "high",
+    "language": "low",
+    "location": "low",
+}
+_DETAIL_RANK = {"low": 0, "auto": 1, "high": 2}
+
+RESPONSE_SCHEMAS = {
+    "pricing": CATEGORIZE_JSON_SCHEMA,
+    "language": LANGUAGE_JSON_SCHEMA,
+    "location": LOCATION_JSON_SCHEMA,
+    "target_demographics": TARGET_DEMOGRAPHICS_JSON_SCHEMA,
+    "categorization_tags": CATEGORIZATION_TAGS_JSON_SCHEMA,
+    "content_tags": CONTENT_TAGS_JSON_SCHEMA,
+    "professional_attributes": PROFESSIONAL_ATTRIBUTES_JSON_SCHEMA,
+    "brand_elements": BRAND_ELEMENTS_JSON_SCHEMA,
+}
+
+def llm_cache_key(
+    model: str, prompt: str, images: List[EncodedImage], response_schema: dict = None, detail: str = None
+) -> str:
+    """
+    Content-addressed key for an LLM result: model, prompt text, response
+    schema and image detail (if any) and image bytes.
+    """
+    parts = [model, prompt]
+    if response_schema is not None:
+        parts.append(json.dumps(response_schema, sort_keys=True))
+    if detail is not None:
+        parts.append(f"detail={detail}")
+    return make_cache_key(*parts, *[image.digest for image in images])
+
+def combined_response_schema(response_schemas: Dict[str, dict]) -> dict:
+    """
+    JSON schema for a combined request: one required top-level key per section.
+    """
+    return {
+        "type": "object",
+        "properties": dict(response_schemas),
+        "required": list(response_schemas),
+        "additionalProperties": False,
+    }
+
+async def cached_json_response(
+    images: List[EncodedImage],
+    prompt: str,
+    use_cache: bool = True,
+    refresh: bool = False,
+    response_schema: dict = None,
+    schema_name: str = "response",
+    detail: str = None,
+) -> Any:
+    """
+    Returns the parsed JSON response for the prompt, served from and stored in
+    the persistent LLM cache. `refresh` skips the lookup but still stores the
+    new result. With `response_schema` the model emits bare JSON matching it
+    and the text is parsed directly; otherwise the JSON is extracted from a
+    fenced block. Raises json.JSONDecodeError if the response cannot be parsed.
+    """
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    cache_key = llm_cache_key(ANALYSIS_MODEL, prompt, images, response_schema, detail) if use_cache else None
+    with span("llm.schema", schema=schema_name, cache_hit=False, structured=response_schema is not None) as request:
+        if use_cache and not refresh:
+            cached = await asyncio.to_thread(llm_cache.get, cache_key)
+            if cached is not None:
+                request.set(cache_hit=True)
+                record_cache_hit(schema_name)
+                return cached
+
+        response_text = await openai_response(
+            images=images, prompt=prompt, model=ANALYSIS_MODEL, response_schema=response_schema, schema_name=schema_name,
+            detail=detail,
+        )
+        with span("llm.parse", schema=schema_name, chars=len(response_text)):
+            if response_schema is None:
+                response_text = extract_x(response_text, "json")
+            parsed = json.loads(response_text)
+        if use_cache:
+            await asyncio.to_thread(llm_cache.set, cache_key, parsed)
+        return parsed
 
 async def categorize(
-    images: List[str], category_schema: str
+    images: List[EncodedImage],
+    category_schema: str,
+    use_cache: bool = True,
+    refresh: bool = False,
+    response_schema: dict = None,
+    schema_name: str = "response",
+    detail: str = None,
 ) -> Dict[str, Any]:
     """
     Calls the AI model with images and a specific category schema,
-    then parses the JSON response.
+    then parses the JSON response. Parsed results are cached by model,
+    prompt and image content unless `use_cache` is False.
+    An unparsable response is re-requested up to SCHEMA_REPAIR_ATTEMPTS times.
     """
     prompt = BASE_PROMPT_TEMPLATE.format(category_schema)
-    response_text = await openai_response(images=images, prompt=prompt, model="gpt-4.1-mini")
+    for attempt in range(SCHEMA_REPAIR_ATTEMPTS + 1):
+        try:
+            return await cached_json_response(
+                images, prompt, use_cache=use_cache, refresh=refresh,
+                response_schema=response_schema, schema_name=schema_name, detail=detail,
+            )
+        except json.JSONDecodeError as e:
+            logging.error(
+                f"Error decoding JSON from AI response for schema starting with: {category_schema[:50]}... (attempt {attempt + 1})"
+            )
+            logging.error(f"Error: {e}")
+            logging.error(f"Received response: {e.doc}")
+            raw_response = e.doc
+    return {
+        "error": "Failed to parse JSON response",
+        "raw_response": raw_response,
+    }
 
-    response_json = extract_x(response_text,"json")
+async def categorize_combined(
+    images: List[EncodedImage],
+    category_schemas: Dict[str, str],
+    use_cache: bool = True,
+    refresh: bool = False,
+    response_schemas: Dict[str, dict] = None,
+    detail: str = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Calls the AI model once with several category schemas merged into a
+    single request, then splits the JSON response back into one result per key.
+    Sections that are missing or unparsable are repaired with one request
+    per failed key, leaving the good sections alone.
+    """
+    sections = "".join(
+        COMBINED_SECTION_TEMPLATE.format(key=key, schema=schema)
+        for key, schema in category_schemas.items()
+    )
+    keys = ", ".join(f'"{key}"' for key in category_schemas)
+    prompt = COMBINED_PROMPT_TEMPLATE.format(keys=keys, sections=sections)
+    response_schema = combined_response_schema(response_schemas) if response_schemas else None
     try:
-        return json.loads(response_json)
-    except json.JSONDecodeError as e:
-        logging.error(
-            f"Error decoding JSON from AI response for schema starting with: {category_schema[:50]}..."
+        combined = await cached_json_response(
+            images, prompt, use_cache=use_cache, refresh=refresh,
+            response_schema=response_schema, schema_name="combined", detail=detail,
         )
+    except json.JSONDecodeError as e:
+        logging.error(f"Error decoding combined JSON from AI response for schemas: {keys}")
         logging.error(f"Error: {e}")
-        logging.error(f"Received response: {response_json}")
-        return {
-            "error": "Failed to parse JSON response",
-            "raw_response": response_json,
-        }
+        logging.error(f"Received response: {e.doc}")
+        combined = None
+
+    results = {}
+    for key in category_schemas:
+        value = combined.get(key) if isinstance(combined, dict) else None
+        if isinstance(value, dict):
+            results[key] = value
+        elif combined is not None:
+            logging.error(f"Combined AI response is missing section: {key}")
+
+    failed = [key for key in category_schemas if key not in results]
+    if failed and SCHEMA_REPAIR_ATTEMPTS > 0:
+        logging.warning(f"Repairing sections separately: {', '.join(failed)}")
+        repaired = await asyncio.gather(*[
+            categorize(
+                images, category_schemas[key], use_cache, refresh,
+                response_schema=(response_schemas or {}).get(key), schema_name=key, detail=detail,
+            )
+            for key in failed
+        ])
+        results.update(zip(failed, repaired))
+    for key in failed:
+        results.setdefault(key, {
+            "error": "Failed to parse JSON response" if combined is None else "Section missing from combined JSON response",
+            "raw_response": json.dumps(combined),
+        })
+    return {key: results[key] for key in category_schemas}
 
 async def analyze_asset(
-    asset_name: str, 
-    images: List[str], 
+    asset_name: str,
+    images: List[str],
+    mode: str = "separate",
+    group_size: int = None,
+    use_cache: bool = True,
+    refresh_cache: bool = False,
+    structured_output: bool = None,
+    image_policy: ImagePolicy = None,
+    schema_detail: Dict[str, str] = None,
 ) -> Dict[str, Any]:
     """
     Analyzes various aspects of a brand using AI based on provided images, with async gather.
-    
+
     Args:
         asset_name: Name of the asset being analyzed
-        images: List of image URLs or base64 encoded images
-    
+        images: List of image paths, PIL images, encoded bytes or EncodedImage objects
+        mode: "separate" sends one request per schema, "combined" merges schemas
+              into shared requests
+        group_size: In combined mode, the number of schemas per request
+                    (e.g. 4 for two requests). Defaults to all schemas in one request.
+        use_cache: Serve and store parsed results in the persistent LLM cache
+        refresh_cache: Ignore cached results but store the fresh ones
+        structured_output: Constrain responses to RESPONSE_SCHEMAS.
+                           Defaults to STRUCTURED_OUTPUTS
+        image_policy: Encoding format, quality, size and default detail of the
+                      images. Defaults to ImagePolicy.default()
+        schema_detail: Image detail per schema key, defaults to SCHEMA_IMAGE_DETAIL.
+                       A combined request uses the highest detail of its keys
+
     Returns:
         Dictionary of analysis results
     """
-    
-    categories_to_analyze = {
-        "pricing": CATEGORIZE_PROMPT,
-        "language": LANGUAGE_SCHEMA,
-        "location": LOCATION_SCHEMA,
-        "target_demographics": TARGET_DEMOGRAPHICS_SCHEMA,
-        "categorization_tags": CATEGORIZATION_TAGS_SCHEMA,
-        "content_tags": CONTENT_TAGS_SCHEMA,
-        "professional_attributes": PROFESSIONAL_ATTRIBUTES_SCHEMA,
-        "brand_elements": BRAND_ELEMENTS_SCHEMA,
-    }
+    if mode not in ("separate", "combined"):
+        raise ValueError(f"Unknown analysis mode: {mode}. Expected 'separate' or 'combined'")
+
+    categories_to_analyze = CATEGORIES_TO_ANALYZE
+    if structured_output is None:
+        structured_output = STRUCTURED_OUTPUTS
+    response_schemas = RESPONSE_SCHEMAS if structured_output else {}
+    if mode == "separate":
+        group_size = 1
+    elif group_size is None:
+        group_size = len(categories_to_analyze)
+
+    if image_policy is None:
+        image_policy = ImagePolicy.default()
+    if schema_detail is None:
+        schema_detail = SCHEMA_IMAGE_DETAIL
 
     brand_analysis_results = {}
-    
-    # Create tasks for each category
+
+    # Group categories and pick the image policy of each group
+    keys = list(categories_to_analyze)
+    groups = []
+    for i in range(0, len(keys), group_size):
+        group = {key: categories_to_analyze[key] for key in keys[i:i + group_size]}
+        detail = max((schema_detail.get(key, image_policy.detail) for key in group), key=_DETAIL_RANK.get)
+        groups.append((group, image_policy.with_detail(detail)))
+
+    # Encode each collage once per distinct encoding and share it across schema calls;
+    # policies differing only in detail send the same bytes
+    policies = list({policy.encoding: policy for _, policy in groups}.values())
+    encoded = await asyncio.gather(*[encode_images(images, policy) for policy in policies])
+    encodings = {policy.encoding: encoded_images for policy, encoded_images in zip(policies, encoded)}
+
+    # Create one task per group of categories
     tasks = []
-    for key, schema in categories_to_analyze.items():
-        tasks.append((key, categorize(images, schema)))
+    for group, policy in groups:
+        encoded_images, detail = encodings[policy.encoding], policy.detail
+        if len(group) == 1:
+            key, schema = next(iter(group.items()))
+            tasks.append((list(group), categorize(
+                encoded_images, schema, use_cache, refresh_cache,
+                response_schema=response_schemas.get(key), schema_name=key, detail=detail,
+            )))
+        else:
+            group_schemas = {key: response_schemas[key] for key in group} if response_schemas else None
+            tasks.append((list(group), categorize_combined(
+                encoded_images, group, use_cache, refresh_cache, response_schemas=group_schemas, detail=detail,
+            )))
 
-    # Gather results
-    try:
-        results = await asyncio.gather(*[task[1] for task in tasks])
-        for (key, _), result in zip(tasks, results):
-            brand_analysis_results[key] = result
-    except Exception as e:
-        logging.error(f"Error during async analysis for asset {asset_name}: {e}")
-        for key, _ in tasks:
-            brand_analysis_results[key] = {
-                "error": str(e),
-                "details": "Analysis failed for this category.",
-            }
-
-    return brand_analysis_results
\ No newline at end of file
+    # Gather results, isolating failures to the keys of the failed request
+    results = await asyncio.gather(*[task[1] for task in tasks], return_exceptions=True)
+    for (group_keys, _), result in zip(tasks, results):
+        if isinstance(result, Exception):
+            logging.error(f"Error during async analysis for asset {asset_name} ({', '.join(group_keys)}): {result}")
+            for key in group_keys:
+                brand_analysis_results[key] = {
+                    "error": str(result),
+                    "details": "Analysis failed for this category.",
+                }
+        elif len(group_keys) == 1:
+            brand_analysis_results[group_keys[0]] = result
+        else:
+            brand_analysis_results.update(result)
+
+    return brand_analysis_results
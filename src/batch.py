@@ -0,0 +1,230 @@
+import json
+import time
+import asyncio
+import logging
+import argparse
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Tuple, Union
+
+from src.clients import http_session_scope, set_concurrency_limit, openai_governor
+from src.pricing import get_pricing_from_instagram
+from src.usage import track_usage
+
+ProfileInput = Union[str, Tuple[str, str], Dict[str, Any]]
+
+
+def normalize_profile(profile: ProfileInput) -> Tuple[str, str]:
+    """
+    Accept a profile URL, a (url, name) tuple or a sample-profile dict
+    ({"profile_link": ..., "Username": ...}) and return (url, name).
+    The name defaults to the last path segment of the URL.
+    """
+    if isinstance(profile, dict):
+        page_url = profile.get("profile_link") or profile.get("page_url") or profile.get("url")
+        page_name = profile.get("Username") or profile.get("page_name")
+    elif isinstance(profile, (tuple, list)):
+        page_url, page_name = profile
+    else:
+        page_url, page_name = profile, None
+    if not page_url:
+        raise ValueError(f"Profile has no URL: {profile}")
+    page_url = page_url.strip()
+    if not page_name:
+        page_name = page_url.rstrip("/").split("?")[0].rsplit("/", 1)[-1]
+    return page_url, page_name
+
+
+def profile_key(page_url: str) -> str:
+    """Identify a profile URL regardless of case, query string and trailing slash."""
+    return page_url.strip().split("?")[0].rstrip("/").lower()
+
+
+async def iter_pricing(
+    profiles: Iterable[ProfileInput],
+    concurrency: int = 10,
+    pricer: Callable = get_pricing_from_instagram,
+    **pricer_kwargs,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Price many profiles concurrently and yield one record per profile as soon
+    as it completes (not in input order). At most `concurrency` profiles are
+    in flight; the input iterable is consumed lazily, so it can be large.
+
+    Records look like {"page_url", "page_name", "pricing", "elapsed_seconds"},
+    with "error" instead of "pricing" when the pipeline raised.
+    """
+    inputs = asyncio.Queue(maxsize=concurrency)
+    outputs = asyncio.Queue(maxsize=concurrency)
+    done = object()
+
+    async def feed():
+        for profile in profiles:
+            await inputs.put(profile)
+        for _ in range(concurrency):
+            await inputs.put(done)
+
+    async def work():
+        while True:
+            profile = await inputs.get()
+            if profile is done:
+                await outputs.put(done)
+                return
+            started = time.perf_counter()
+            try:
+                page_url, page_name = normalize_profile(profile)
+            except ValueError as e:
+                await outputs.put({"profile": profile, "error": str(e)})
+                continue
+            record = {"page_url": page_url, "page_name": page_name}
+            try:
+                record["pricing"] = await pricer(page_url, page_name, **pricer_kwargs)
+            except Exception as e:
+                logging.error(f"Pricing failed for {page_url}: {e}")
+                record["error"] = str(e)
+            record["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+            await outputs.put(record)
+
+    tasks = [asyncio.create_task(feed())] + [asyncio.create_task(work()) for _ in range(concurrency)]
+    try:
+        remaining = concurrency
+        while remaining:
+            record = await outputs.get()
+            if record is done:
+                remaining -= 1
+            else:
+                yield record
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def price_profiles_to_jsonl(
+    profiles: Iterable[ProfileInput],
+    output_path: str,
+    concurrency: int = 10,
+    stage_workers: Dict[str, int] = None,
+    **pricer_kwargs,
+) -> Dict[str, Any]:
+    """
+    Price profiles concurrently, appending each record to `output_path` as a
+    JSON line as soon as it completes. Returns counts of priced and failed
+    profiles and the batch's total LLM usage and cost.
+    With `stage_workers`, profiles go through the staged pipeline
+    (src.pipeline) instead of `concurrency` end-to-end workers.
+    """
+    if stage_workers is not None:
+        # Imported here because src.pipeline builds on this module
+        from src.pipeline import iter_pipelined_pricing
+        records = iter_pipelined_pricing(profiles, stage_workers=stage_workers, **pricer_kwargs)
+    else:
+        records = iter_pricing(profiles, concurrency=concurrency, **pricer_kwargs)
+
+    summary = {"priced": 0, "failed": 0}
+    async with http_session_scope():
+        with track_usage() as usage, open(output_path, "a") as f:
+            async for record in records:
+                f.write(json.dumps(record, default=str) + "\n")
+                f.flush()
+                if record_failed(record):
+                    summary["failed"] += 1
+                else:
+                    summary["priced"] += 1
+                logging.info(f"Batch progress: {summary['priced']} priced, {summary['failed']} failed")
+    logging.info(f"OpenAI governor: {openai_governor.metrics()}")
+    summary["usage"] = usage.summary()["total"]
+    logging.info(f"LLM usage: {summary['usage']}")
+    return summary
+
+
+def load_profiles(path: str) -> Iterable[ProfileInput]:
+    """
+    Load profiles from a JSON list (sample-profile dicts or URLs) or a text
+    file with one URL per line.
+    """
+    if path.endswith(".json"):
+        with open(path, "r") as f:
+            return json.load(f)
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def record_failed(record: Dict[str, Any]) -> bool:
+    """Whether a batch record is a failure, at the top level or inside its pricing."""
+    return "error" in record or "error" in record.get("pricing", {})
+
+
+def already_priced(output_path: str) -> set:
+    """Return the page URLs that already have a successful record in `output_path`."""
+    seen = set()
+    try:
+        with open(output_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if not record_failed(record):
+                    seen.add(record.get("page_url"))
+    except FileNotFoundError:
+        pass
+    return seen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price many Instagram profiles concurrently")
+    parser.add_argument("input", help="JSON list of profiles or text file with one URL per line")
+    parser.add_argument("output", help="JSONL file that results are appended to")
+    parser.add_argument("--concurrency", type=int, default=10, help="profiles in flight")
+    parser.add_argument("--rapidapi-concurrency", type=int, help="in-flight RapidAPI requests")
+    parser.add_argument("--download-concurrency", type=int, help="in-flight image downloads")
+    parser.add_argument("--openai-concurrency", type=int, help="in-flight OpenAI requests")
+    parser.add_argument("--analysis-mode", choices=["separate", "combined"], default="separate")
+    parser.add_argument("--group-size", type=int, help="schemas per request in combined mode")
+    parser.add_argument("--resume", action="store_true", help="skip profiles already priced in the output file")
+    parser.add_argument("--incremental", action="store_true", help="only fetch posts newer than the last run")
+    parser.add_argument("--pipeline", action="store_true", help="overlap fetch, collage and LLM stages across profiles")
+    parser.add_argument("--fetch-workers", type=int, help="pipeline workers fetching profiles from RapidAPI")
+    parser.add_argument("--collage-workers", type=int, help="pipeline workers building collages")
+    parser.add_argument("--analysis-workers", type=int, help="pipeline workers running LLM analysis")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    for service, limit in [
+        ("rapidapi", args.rapidapi_concurrency),
+        ("downloads", args.download_concurrency),
+        ("openai", args.openai_concurrency),
+    ]:
+        if limit:
+            set_concurrency_limit(service, limit)
+
+    profiles = load_profiles(args.input)
+    if args.resume:
+        seen = already_priced(args.output)
+        profiles = [profile for profile in profiles if normalize_profile(profile)[0] not in seen]
+
+    stage_workers = None
+    if args.pipeline:
+        stage_workers = {
+            stage: workers
+            for stage, workers in [
+                ("fetch", args.fetch_workers),
+                ("collages", args.collage_workers),
+                ("analysis", args.analysis_workers),
+            ]
+            if workers
+        }
+
+    summary = asyncio.run(price_profiles_to_jsonl(
+        profiles,
+        args.output,
+        concurrency=args.concurrency,
+        stage_workers=stage_workers,
+        analysis_mode=args.analysis_mode,
+        group_size=args.group_size,
+        incremental=args.incremental,
+    ))
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Local stand-ins for RapidAPI, the Instagram image CDN and the OpenAI
+Responses API, so the pipeline can be benchmarked without spending quota.
+
+    python -m src.benchmarks.fakes --port 8765 --config fakes.json
+
+Point the pipeline at it with RAPID_API_BASE_URL=http://127.0.0.1:8765 and
+OPENAI_BASE_URL=http://127.0.0.1:8765/v1. Every service has its own latency,
+jitter and error rate; payload sizes (posts per chunk, caption length, image
+dimensions, how many distinct thumbnails the CDN cycles through) are
+configurable too, e.g.
+{"openai": {"latency_ms": 1500, "error_rate": 0.05}, "image_width": 640}.
+A low "distinct_images" simulates repost-heavy pages with near-duplicate thumbnails.
+GET /_stats returns request counts.
+"""
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from io import BytesIO
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+
+import numpy as np
+from aiohttp import web
+from PIL import Image
+
+
+@dataclass
+class FakeService:
+    latency_ms: float = 100.0
+    jitter_ms: float = 30.0
+    error_rate: float = 0.0
+    # Share of injected errors that are 429s rather than 500s
+    throttle_share: float = 0.5
+
+
+@dataclass
+class FakeConfig:
+    rapidapi: FakeService = field(default_factory=lambda: FakeService(latency_ms=300, jitter_ms=100))
+    cdn: FakeService = field(default_factory=lambda: FakeService(latency_ms=40, jitter_ms=20))
+    openai: FakeService = field(default_factory=lambda: FakeService(latency_ms=2500, jitter_ms=800))
+    posts_per_chunk: int = 12
+    total_posts: int = 60
+    caption_chars: int = 400
+    image_width: int = 1080
+    image_height: int = 1350
+    distinct_images: int = 64
+    follower_range: tuple = (10_000, 5_000_000)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FakeConfig":
+        services = {name: FakeService(**data[name]) for name in ("rapidapi", "cdn", "openai") if name in data}
+        return cls(**{key: value for key, value in data.items() if key not in services} | services)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def stable_int(text: str, low: int, high: int) -> int:
+    """Deterministic pseudo-random integer in [low, high] for `text`."""
+    return low + int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:12], 16) % (high - low + 1)
+
+
+def sample_json(schema: Dict[str, Any]) -> Any:
+    """Build a value that satisfies a (strict structured output) JSON schema."""
+    if "enum" in schema:
+        return next((value for value in schema["enum"] if value is not None), None)
+    types = schema.get("type", "object")
+    kind = next((t for t in types if t != "null"), "null") if isinstance(types, list) else types
+    if kind == "object":
+        return {key: sample_json(value) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [sample_json(schema.get("items", {"type": "string"}))]
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return False
+    if kind == "string":
+        return "benchmark"
+    return None
+
+
+class FakeUpstreams:
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.requests = Counter()
+        self.errors = Counter()
+        self._images: Dict[tuple, bytes] = {}
+
+    async def _delay_or_fail(self, service: str) -> web.Response:
+        settings: FakeService = getattr(self.config, service)
+        self.requests[service] += 1
+        delay = max(0.0, random.gauss(settings.latency_ms, settings.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+        if random.random() < settings.error_rate:
+            self.errors[service] += 1
+            status = 429 if random.random() < settings.throttle_share else 500
+            return web.json_response({"error": "injected failure"}, status=status, headers={"Retry-After": "0.2"})
+        return None
+
+    def _image(self, width: int, height: int, variant: int) -> bytes:
+        key = (width, height, variant)
+        if key not in self._images:
+            # Noise compresses poorly, so sizes resemble real photos rather than flat fills;
+            # a coarse per-variant pattern on top makes variants perceptually distinct
+            noise = np.random.default_rng(0).random((height, width, 3))
+            pattern = Image.fromarray((np.random.default_rng(variant + 1).random((8, 9)) * 255).astype("uint8"))
+            coarse = np.asarray(pattern.resize((width, height), Image.Resampling.NEAREST), dtype=float)[:, :, None] / 255
+            pixels = ((0.4 * noise + 0.6 * coarse) * 255).astype("uint8")
+            buffered = BytesIO()
+            Image.fromarray(pixels).save(buffered, format="JPEG", quality=80)
+            self._images[key] = buffered.getvalue()
+        return self._images[key]
+
+    async def user_by_url(self, request: web.Request) -> web.Response:
+        failure = await self._delay_or_fail("rapidapi")
+        if failure is not None:
+            return failure
+        page_url = request.query.get("url", "")
+        username = page_url.rstrip("/").rsplit("/", 1)[-1] or "unknown"
+        return web.json_response({
+            "pk": str(stable_int(username, 10**9, 10**10)),
+            "username": username,
+            "full_name": username.title(),
+            "biography": "Benchmark profile",
+            "follower_count": stable_int(username, *self.config.follower_range),
+            "is_verified": False,
+            "is_private": False,
+            "media_count": self.config.total_posts,
+        })
+
+    async def medias_chunk(self, request: web.Request) -> web.Response:
+        failure = await self._delay_or_fail("rapidapi")
+        if failure is not None:
+            return failure
+        user_id = request.query.get("user_id", "0")
+        offset = int(request.query.get("end_cursor") or 0)
+        count = max(0, min(self.config.posts_per_chunk, self.config.total_posts - offset))
+        base_url = f"{request.scheme}://{request.host}"
+        now = datetime.now(timezone.utc)
+        width, height = self.config.image_width, self.config.image_height
+        posts = []
+        for index in range(offset, offset + count):
+            image_url = f"{base_url}/cdn/{user_id}/{index}.jpg?stp=dst-jpg_e35_p{width}x{height}"
+            posts.append({
+                "code": f"{user_id}-{index}",
+                "taken_at": (now - timedelta(hours=6 * (index + 1))).isoformat().replace("+00:00", "Z"),
+                "media_type": 1,
+                "like_count": stable_int(f"{user_id}-{index}-likes", 100, 50_000),
+                "comment_count": stable_int(f"{user_id}-{index}-comments", 0, 2_000),
+                "caption_text": "#benchmark " + "x" * self.config.caption_chars,
+                "image_versions": [{"url": image_url, "width": width, "height": height}],
+                "user": {"username": user_id, "full_name": user_id},
+            })
+        next_cursor = str(offset + count) if offset + count < self.config.total_posts else None
+        return web.json_response([posts, next_cursor])
+
+    async def cdn_image(self, request: web.Request) -> web.Response:
+        failure = await self._delay_or_fail("cdn")
+        if failure is not None:
+            return failure
+        index = int(request.match_info["name"].split(".")[0] or 0)
+        variant = index % max(1, self.config.distinct_images)
+        return web.Response(
+            body=self._image(self.config.image_width, self.config.image_height, variant), content_type="image/jpeg"
+        )
+
+    async def responses(self, request: web.Request) -> web.Response:
+        failure = await self._delay_or_fail("openai")
+        if failure is not None:
+            return failure
+        body = await request.json()
+        text_format = (body.get("text") or {}).get("format") or {}
+        if text_format.get("type") == "json_schema":
+            text = json.dumps(sample_json(text_format["schema"]))
+        else:
+            text = '```json\n{"category": "general"}\n```'
+        images = sum(
+            part.get("type") == "input_image"
+            for message in body.get("input", [])
+            for part in message.get("content", [])
+        )
+        input_tokens = 100 + images * (85 if any(
+            part.get("detail") == "low" for message in body.get("input", []) for part in message.get("content", [])
+        ) else 765)
+        output_tokens = max(1, len(text) // 4)
+        return web.json_response({
+            "id": f"resp_{random.getrandbits(64):x}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": body.get("model"),
+            "status": "completed",
+            "output": [{
+                "type": "message",
+                "id": f"msg_{random.getrandbits(64):x}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": input_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": output_tokens,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": input_tokens + output_tokens,
+            },
+        })
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"requests": dict(self.requests), "errors": dict(self.errors)})
+
+
+def create_fake_app(config: FakeConfig = None) -> web.Application:
+    upstreams = FakeUpstreams(config or FakeConfig())
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_get("/v1/user/by/url", upstreams.user_by_url)
+    app.router.add_get("/v1/user/medias/chunk", upstreams.medias_chunk)
+    app.router.add_get("/cdn/{user_id}/{name}", upstreams.cdn_image)
+    app.router.add_post("/v1/responses", upstreams.responses)
+    app.router.add_get("/_stats", upstreams.stats)
+    return app
+
+
+def serve(config: Dict[str, Any], host: str = "127.0.0.1", port: int = 8765):
+    """Run the fakes until killed; takes a plain dict so it can be a process target."""
+    web.run_app(create_fake_app(FakeConfig.from_dict(config)), host=host, port=port, print=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake RapidAPI, CDN and OpenAI endpoints")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--config", help="JSON file with FakeConfig fields")
+    args = parser.parse_args()
+    config = {}
+    if args.config:
+        with open(args.config, "r") as f:
+            config = json.load(f)
+    serve(config, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Compare LLM image policies on the same collages: upload bytes, estimated
+image tokens and how often each setting agrees with the baseline (lossless
+PNG at the API's default detail, the previous behaviour).
+
+    python -m src.benchmarks.image_policy collages/page_a collages/page_b --output report.json
+
+Each argument is a directory of collage images for one page, or a single image.
+"""
+import os
+import json
+import asyncio
+import logging
+import argparse
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image
+
+from src.clients import ImagePolicy, encode_images, estimate_input_tokens, openai_governor
+from src.agents import analyze_asset, CATEGORIES_TO_ANALYZE, SCHEMA_IMAGE_DETAIL
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+# name -> (policy, per-schema detail); an empty detail map uses the policy's detail everywhere
+SETTINGS: Dict[str, Tuple[ImagePolicy, Dict[str, str]]] = {
+    "png-auto": (ImagePolicy("PNG"), {}),
+    "jpeg85": (ImagePolicy("JPEG", 85), {}),
+    "webp80": (ImagePolicy("WEBP", 80), {}),
+    "jpeg85-768px": (ImagePolicy("JPEG", 85, max_size=768), {}),
+    "jpeg85-per-schema": (ImagePolicy("JPEG", 85), SCHEMA_IMAGE_DETAIL),
+    "jpeg85-low": (ImagePolicy("JPEG", 85, detail="low"), {}),
+}
+BASELINE = "png-auto"
+
+
+def load_pages(paths: List[str]) -> Dict[str, List[Image.Image]]:
+    pages = {}
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        else:
+            files = [path]
+        if files:
+            pages[os.path.basename(os.path.normpath(path))] = [Image.open(file).convert("RGB") for file in files]
+    return pages
+
+
+def normalize(value: Any) -> Any:
+    """Compare answers case-insensitively, and lists as sets."""
+    if isinstance(value, list):
+        return sorted({str(item).strip().lower() for item in value})
+    if isinstance(value, str):
+        return value.strip().lower()
+    return value
+
+
+def field_agreement(result: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Tuple[int, int]]:
+    """
+    Return {schema_key: (matching fields, compared fields)} against the baseline,
+    skipping schemas that errored in either run.
+    """
+    agreement = {}
+    for key, expected in baseline.items():
+        actual = result.get(key, {})
+        if "error" in expected or "error" in actual:
+            continue
+        fields = [field for field in expected if field != "paragraph"]
+        matches = sum(normalize(actual.get(field)) == normalize(expected[field]) for field in fields)
+        agreement[key] = (matches, len(fields))
+    return agreement
+
+
+async def payload_cost(images: List[Image.Image], policy: ImagePolicy, schema_detail: Dict[str, str]) -> Dict[str, int]:
+    """Upload bytes and estimated image tokens of one analysis in separate mode."""
+    upload_bytes, image_tokens = 0, 0
+    for key in CATEGORIES_TO_ANALYZE:
+        key_policy = policy.with_detail(schema_detail.get(key, policy.detail))
+        encoded = await encode_images(images, key_policy)
+        upload_bytes += sum(len(image.data_url) for image in encoded)
+        image_tokens += estimate_input_tokens(encoded, "", key_policy.detail)
+    return {"upload_bytes": upload_bytes, "image_tokens": image_tokens}
+
+
+async def run(paths: List[str], settings: List[str], use_cache: bool) -> Dict[str, Any]:
+    pages = load_pages(paths)
+    if not pages:
+        raise ValueError("No images found in the given paths")
+    settings = [BASELINE] + [name for name in settings if name != BASELINE]
+
+    report = {}
+    results = {}
+    for name in settings:
+        policy, schema_detail = SETTINGS[name]
+        totals = {"upload_bytes": 0, "image_tokens": 0}
+        results[name] = {}
+        for page, images in pages.items():
+            cost = await payload_cost(images, policy, schema_detail)
+            for metric, value in cost.items():
+                totals[metric] += value
+            results[name][page] = await analyze_asset(
+                page, images, use_cache=use_cache, image_policy=policy, schema_detail=schema_detail
+            )
+        report[name] = totals
+
+    for name in settings:
+        per_key = {}
+        for page in pages:
+            for key, (matches, fields) in field_agreement(results[name][page], results[BASELINE][page]).items():
+                total = per_key.setdefault(key, [0, 0])
+                total[0] += matches
+                total[1] += fields
+        matches = sum(m for m, _ in per_key.values())
+        fields = sum(f for _, f in per_key.values())
+        report[name]["agreement"] = round(matches / fields, 3) if fields else None
+        report[name]["agreement_by_schema"] = {key: round(m / f, 3) if f else None for key, (m, f) in per_key.items()}
+        report[name]["pricing_category_agreement"] = round(sum(
+            normalize(results[name][page].get("pricing", {}).get("category"))
+            == normalize(results[BASELINE][page].get("pricing", {}).get("category"))
+            for page in pages
+        ) / len(pages), 3)
+    return {"pages": len(pages), "settings": report, "openai": openai_governor.metrics()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare LLM image policies against the PNG baseline")
+    parser.add_argument("paths", nargs="+", help="directories of collages (one per page) or image files")
+    parser.add_argument("--settings", nargs="+", choices=list(SETTINGS), default=list(SETTINGS))
+    parser.add_argument("--no-cache", action="store_true", help="bypass the LLM cache")
+    parser.add_argument("--output", help="write the full report as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report = asyncio.run(run(args.paths, args.settings, use_cache=not args.no_cache))
+
+    print(f"{'setting':<20}{'upload KB':>12}{'image tokens':>14}{'agreement':>11}{'pricing':>9}")
+    for name, row in report["settings"].items():
+        print(
+            f"{name:<20}{row['upload_bytes'] / 1024:>12.0f}{row['image_tokens']:>14}"
+            f"{row['agreement'] if row['agreement'] is not None else '-':>11}{row['pricing_category_agreement']:>9}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Import-time benchmark: how long a cold interpreter takes to import each
+entry point, and which heavy dependencies it pulls in.
+
+    python -m src.benchmarks.import_time --repeat 5
+    python -m src.benchmarks.import_time --target src.pricing:classify_pricing --top 15
+
+Each measurement runs in a fresh interpreter, so nothing is shared between
+runs except the OS file cache. `--top` adds the slowest modules reported by
+`python -X importtime`, to find what to defer next.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from typing import Any, Dict, List
+
+import numpy as np
+
+DEFAULT_TARGETS = [
+    "src.pricing:classify_pricing",
+    "src.clients",
+    "src.agents",
+    "src.batch",
+    "src.pipeline",
+    "src.server",
+]
+HEAVY_MODULES = ["openai", "aiohttp", "PIL", "pandas", "numpy", "dotenv", "streamlit"]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_PROBE = """
+import sys, time, json, importlib
+started = time.perf_counter()
+module = importlib.import_module({module!r})
+if {attribute!r}:
+    getattr(module, {attribute!r})
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def import_statement(target: str) -> str:
+    module, _, attribute = target.partition(":")
+    return f"from {module} import {attribute}" if attribute else f"import {module}"
+
+
+def measure(target: str) -> Dict[str, Any]:
+    """Import `target` ("module" or "module:attribute") in a fresh interpreter."""
+    module, _, attribute = target.partition(":")
+    code = _PROBE.format(module=module, attribute=attribute, heavy=HEAVY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=False
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {target} failed:\n{result.stderr.strip()}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(target: str, top: int) -> List[Dict[str, Any]]:
+    """The `top` modules with the largest cumulative time under -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", import_statement(target)],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=False,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append({"module": name.strip(), "cumulative_ms": round(int(cumulative) / 1000, 1)})
+    rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of the pricing entry points")
+    parser.add_argument("--target", action="append", help="module or module:attribute (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per target")
+    parser.add_argument("--top", type=int, default=0, help="also list the N slowest imports per target")
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    report = {"python": sys.version.split()[0], "targets": {}}
+    print(f"{'target':<34}{'p50 ms':>9}{'min ms':>9}  heavy modules loaded")
+    for target in args.target or DEFAULT_TARGETS:
+        runs = [measure(target) for _ in range(args.repeat)]
+        seconds = [run["seconds"] for run in runs]
+        row = {
+            "p50_ms": round(float(np.percentile(seconds, 50)) * 1000, 1),
+            "min_ms": round(min(seconds) * 1000, 1),
+            "heavy_modules": runs[-1]["loaded"],
+        }
+        if args.top:
+            row["slowest_imports"] = slowest_imports(target, args.top)
+        report["targets"][target] = row
+        print(f"{target:<34}{row['p50_ms']:>9.1f}{row['min_ms']:>9.1f}  {', '.join(row['heavy_modules']) or '-'}")
+        for item in row.get("slowest_imports", []):
+            print(f"    {item['module']:<40}{item['cumulative_ms']:>9.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Offline pipeline benchmark against the local fakes in src/benchmarks/fakes.py.
+
+    python -m src.benchmarks.pipeline --profiles 50 --concurrency 10 --save-baseline bench/baseline.json
+    python -m src.benchmarks.pipeline --profiles 50 --concurrency 10 --baseline bench/baseline.json
+
+Starts the fakes in a separate process, points RapidAPI, image downloads and
+OpenAI at them, and runs three scenarios on fresh profiles: single profiles
+one at a time, a concurrent batch (iter_pricing) and the staged pipeline
+(iter_pipelined_pricing). Reports per-stage latency percentiles, end-to-end
+latency, throughput and peak RSS, and compares them with a stored baseline.
+Each scenario runs in its own process, so its peak RSS is not inflated by
+the scenarios before it.
+"""
+import os
+import sys
+import json
+import queue
+import time
+import socket
+import asyncio
+import resource
+import argparse
+import tempfile
+import multiprocessing
+from collections import defaultdict
+from typing import Any, Dict, List
+
+import numpy as np
+
+STAGES = ["fetch_profile", "build_collages", "analyze_collages", "finish_pricing"]
+SCENARIOS = ["single", "batch", "pipeline"]
+# Metrics compared against the baseline, and whether higher is better
+COMPARED_METRICS = {
+    "latency_p50": False,
+    "latency_p90": False,
+    "throughput_per_second": True,
+    "peak_rss_mb": False,
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def configure_environment(base_url: str, cache_dir: str):
+    """
+    Point every external dependency at the fakes and every cache at a fresh
+    directory. Must run before src.clients is imported.
+    """
+    os.environ.update({
+        "RAPID_API_BASE_URL": base_url,
+        "RAPID_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "OPENAI_API_KEY": "benchmark",
+        # Fake images share bytes, so a content-addressed LLM cache would hit on every profile
+        "LLM_CACHE_ENABLED": "false",
+        "IMAGE_CACHE_DIR": os.path.join(cache_dir, "images"),
+        "PROFILE_STATE_PATH": os.path.join(cache_dir, "profile_state.sqlite"),
+        "THUMBNAIL_HASH_CACHE_PATH": os.path.join(cache_dir, "thumbnail_hashes.sqlite"),
+    })
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    return {
+        "count": len(values),
+        "p50": round(float(np.percentile(values, 50)), 4),
+        "p90": round(float(np.percentile(values, 90)), 4),
+        "p99": round(float(np.percentile(values, 99)), 4),
+        "mean": round(float(np.mean(values)), 4),
+    }
+
+
+def peak_rss_mb() -> float:
+    # High-water mark of this process; ru_maxrss is in KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def instrument_stages(timings: Dict[str, List[float]]):
+    """Wrap the pricing stage functions so each call records its duration."""
+    import src.pricing as pricing
+    import src.pipeline as pipeline
+
+    for name in STAGES:
+        original = getattr(pricing, name)
+
+        async def timed(*args, _original=original, _name=name, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await _original(*args, **kwargs)
+            finally:
+                timings[_name].append(time.perf_counter() - started)
+
+        setattr(pricing, name, timed)
+        setattr(pipeline, name, timed)
+
+
+async def run_scenario(args, scenario: str, timings: Dict[str, List[float]]) -> Dict[str, Any]:
+    from src.clients import http_session_scope
+    from src.batch import iter_pricing
+    from src.pipeline import iter_pipelined_pricing
+    from src.pricing import get_pricing_from_instagram
+
+    def profiles(scenario: str, n: int) -> List[str]:
+        # Fresh usernames per scenario so no scenario is served from another's caches
+        return [f"https://www.instagram.com/bench_{scenario}_{i}/" for i in range(n)]
+
+    async def single():
+        for page_url in profiles("single", args.single_runs):
+            started = time.perf_counter()
+            try:
+                pricing = await get_pricing_from_instagram(page_url, page_url.rstrip("/").rsplit("/", 1)[-1])
+                record = {"pricing": pricing}
+            except Exception as e:
+                record = {"error": str(e)}
+            record["elapsed_seconds"] = time.perf_counter() - started
+            yield record
+
+    runs = {
+        "single": lambda: single(),
+        "batch": lambda: iter_pricing(profiles("batch", args.profiles), concurrency=args.concurrency),
+        "pipeline": lambda: iter_pipelined_pricing(profiles("pipeline", args.profiles)),
+    }
+
+    async with http_session_scope():
+        latencies, failures = [], 0
+        started = time.perf_counter()
+        async for record in runs[scenario]():
+            latencies.append(record.get("elapsed_seconds", 0.0))
+            if "error" in record or "error" in record.get("pricing", {}):
+                failures += 1
+        wall = time.perf_counter() - started
+    latency = percentiles(latencies)
+    print(f"{scenario}: {len(latencies)} profiles in {wall:.2f}s", file=sys.stderr)
+    return {
+        "profiles": len(latencies),
+        "failures": failures,
+        "wall_seconds": round(wall, 3),
+        "throughput_per_second": round(len(latencies) / wall, 4) if wall else 0.0,
+        "latency_p50": latency.get("p50"),
+        "latency_p90": latency.get("p90"),
+        "latency": latency,
+        "stages": {name: percentiles(values) for name, values in timings.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_scenario_process(args, scenario: str, base_url: str, cache_dir: str, results):
+    """Process target: run one scenario in a fresh interpreter and put its report on `results`."""
+    try:
+        configure_environment(base_url, cache_dir)
+        from src.settings import get_settings
+        from src.clients import get_openai_client
+        # .env is loaded with override=True and could point us back at the real services
+        settings = get_settings()
+        if settings.rapid_api_base_url != base_url or not str(get_openai_client().base_url).startswith(base_url):
+            raise RuntimeError("RapidAPI or OpenAI is not pointed at the local fakes (check .env)")
+
+        timings = defaultdict(list)
+        instrument_stages(timings)
+        results.put(asyncio.run(run_scenario(args, scenario, timings)))
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        from src.utils import shutdown_collage_executor
+        # Stop the pool's workers before exiting; the exit handler joins them and they never quit on their own
+        shutdown_collage_executor(wait=True)
+
+
+def run_isolated(args, scenario: str, base_url: str, cache_dir: str) -> Dict[str, Any]:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    worker = context.Process(target=run_scenario_process, args=(args, scenario, base_url, cache_dir, results))
+    worker.start()
+    try:
+        while True:
+            try:
+                report = results.get(timeout=1)
+                break
+            except queue.Empty:
+                if not worker.is_alive():
+                    raise SystemExit(f"Scenario {scenario} exited with code {worker.exitcode}")
+    finally:
+        worker.join()
+    if "error" in report:
+        raise SystemExit(f"Refusing to benchmark {scenario}: {report['error']}")
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Print metric deltas against the baseline and return the regressions."""
+    regressions = []
+    print(f"\n{'scenario':<10}{'metric':<24}{'baseline':>12}{'current':>12}{'delta':>9}")
+    for scenario, metrics in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if not base:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = base.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            delta = (new - old) / old
+            worse = -delta if higher_is_better else delta
+            flag = "  REGRESSION" if worse > tolerance else ""
+            print(f"{scenario:<10}{metric:<24}{old:>12.3f}{new:>12.3f}{delta:>+9.1%}{flag}")
+            if flag:
+                regressions.append(f"{scenario}.{metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pricing pipeline against local fakes")
+    parser.add_argument("--profiles", type=int, default=20, help="profiles per batch/pipeline scenario")
+    parser.add_argument("--single-runs", type=int, default=3, help="profiles priced one at a time")
+    parser.add_argument("--concurrency", type=int, default=10, help="profiles in flight in the batch scenario")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--fakes-config", help="JSON file with FakeConfig fields (latency, errors, payload sizes)")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="compare against a stored report")
+    parser.add_argument("--save-baseline", help="store this report as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args()
+
+    fakes_config = {}
+    if args.fakes_config:
+        with open(args.fakes_config, "r") as f:
+            fakes_config = json.load(f)
+
+    from src.benchmarks.fakes import serve
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    fakes = multiprocessing.get_context("spawn").Process(target=serve, args=(fakes_config, "127.0.0.1", port), daemon=True)
+    fakes.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="pricing-bench-") as cache_dir:
+            scenarios = {scenario: run_isolated(args, scenario, base_url, cache_dir) for scenario in args.scenarios}
+    finally:
+        fakes.terminate()
+        fakes.join()
+
+    report = {"config": vars(args) | {"fakes": fakes_config}, "scenarios": scenarios}
+    print(json.dumps(scenarios, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.save_baseline) or ".", exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
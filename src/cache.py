@@ -0,0 +1,316 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Union
+
+
+def make_cache_key(*parts: Union[str, bytes]) -> str:
+    """
+    Build a content-addressed cache key by hashing the given parts.
+    Each part is length-prefixed so that ("ab", "c") and ("a", "bc") differ.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class SQLiteCache:
+    """
+    A persistent JSON key-value cache stored in a single SQLite file.
+
+    Entries expire after `ttl` seconds and the least recently used entries
+    are evicted once the cache holds more than `max_entries` rows or
+    `max_bytes` of serialized values. The database is opened lazily on
+    first use and can be shared between threads.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+            self._connection.commit()
+        return self._connection
+
+    def get(self, key: str, ttl: Optional[float] = None) -> Optional[Any]:
+        """
+        Return the cached value for `key`, or None if missing or expired.
+        `ttl` overrides the cache-wide TTL for this lookup.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if ttl is not None and now - created_at > ttl:
+                connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                connection.commit()
+                return None
+            connection.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            connection.commit()
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            logging.warning(f"Discarding corrupt cache entry: {key}")
+            self.delete(key)
+            return None
+
+    def set(self, key: str, value: Any):
+        """
+        Store a JSON-serializable value under `key`, then evict if over budget.
+        """
+        serialized = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, len(serialized), now, now),
+            )
+            self._evict(connection, now)
+            connection.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            connection.commit()
+
+    def clear(self):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM cache")
+            connection.commit()
+
+    def _evict(self, connection: sqlite3.Connection, now: float):
+        if self.ttl is not None:
+            connection.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+        if self.max_entries is not None:
+            connection.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total > self.max_bytes:
+                rows = connection.execute("SELECT key, size FROM cache ORDER BY accessed_at ASC").fetchall()
+                evicted = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((key,))
+                    total -= size
+                connection.executemany("DELETE FROM cache WHERE key = ?", evicted)
+
+
+class TTLCache:
+    """
+    An in-memory LRU cache whose entries expire after a per-lookup TTL.
+    Safe to share between the threads of a Streamlit server.
+
+    With `max_bytes`, least recently used entries are also evicted once the
+    values' total `sizeof(value)` exceeds it.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("max_bytes needs a sizeof function")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, ttl: Optional[float] = None) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, created_at, size = entry
+            if ttl is not None and time.time() - created_at > ttl:
+                del self._entries[key]
+                self.bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self._entries[key] = (value, time.time(), size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self.bytes > self.max_bytes and len(self._entries) > 1
+            ):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+
+    def delete(self, key: str):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TieredCache:
+    """
+    An in-memory LRU tier in front of an optional persistent SQLite tier,
+    with hit and miss counters. Persistent hits are promoted to memory.
+    """
+
+    def __init__(self, memory: TTLCache, persistent: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.persistent = persistent
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str, ttl: Optional[float] = None) -> Optional[Any]:
+        value = self.memory.get(key, ttl)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if self.persistent is not None:
+            value = await asyncio.to_thread(self.persistent.get, key, ttl)
+            if value is not None:
+                self.persistent_hits += 1
+                self.memory.set(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            await asyncio.to_thread(self.persistent.set, key, value)
+
+    async def clear(self):
+        self.memory.clear()
+        if self.persistent is not None:
+            await asyncio.to_thread(self.persistent.clear)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+        }
+
+
+class DiskBlobCache:
+    """
+    A directory of raw byte blobs named by key, bounded to `max_bytes`.
+    Reads refresh a blob's mtime and the least recently used blobs are
+    deleted once the directory grows past the budget.
+    """
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._total_bytes = None
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _scan(self):
+        if self._total_bytes is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._total_bytes = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, data: bytes):
+        with self._lock:
+            self._scan()
+            path = self._path(key)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            temporary = f"{path}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+            self._total_bytes += len(data) - previous
+            if self.max_bytes is not None and self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file() and not entry.name.endswith(".tmp")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._total_bytes -= size
+            except FileNotFoundError:
+                continue
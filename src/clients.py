@@ -1,90 +1,658 @@
 import os 
-from dotenv import load_dotenv
-import aiohttp
 from PIL import Image
 from io import BytesIO
-from typing import List, Tuple
+from urllib.parse import urlsplit, parse_qs
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
+from dataclasses import dataclass, replace
+from functools import cached_property
 import base64
+import json
+import hashlib
+import math
+import time
 import logging
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
 
-import openai
+from src.cache import TTLCache, SQLiteCache, TieredCache, DiskBlobCache, make_cache_key
+from src.ratelimit import TokenBucket, CircuitBreaker, RequestGovernor, backoff_delay, parse_retry_after
+from src.settings import get_settings, load_env
+from src.tracing import span, set_attributes
+from src.usage import record_usage
 
-load_dotenv(override=True)
+# openai and aiohttp are slow to import; they are loaded on first use
+if TYPE_CHECKING:
+    import aiohttp
+    import openai
 
-openai_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+load_env()
 
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
 
-async def download_image(url):
+RAPID_API_CACHE_MAX_ENTRIES = int(os.getenv("RAPID_API_CACHE_MAX_ENTRIES", "2048"))
+RAPID_API_CACHE_PATH = os.getenv("RAPID_API_CACHE_PATH")
+
+rapid_api_cache = TieredCache(
+    TTLCache(max_entries=RAPID_API_CACHE_MAX_ENTRIES),
+    SQLiteCache(RAPID_API_CACHE_PATH) if RAPID_API_CACHE_PATH else None,
+)
+
+# Per-service caps on in-flight requests, shared by every caller on a loop
+CONCURRENCY_LIMITS = {
+    "rapidapi": int(os.getenv("RAPID_API_CONCURRENCY", "8")),
+    "downloads": int(os.getenv("DOWNLOAD_CONCURRENCY", "32")),
+    "openai": int(os.getenv("OPENAI_CONCURRENCY", "16")),
+}
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", ".cache/images")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(8 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(4096 * 4096)))
+# Signed CDN URLs expiring within this many seconds are treated as expired
+MEDIA_URL_EXPIRY_MARGIN = 300
+IMAGE_CHUNK_SIZE = 64 * 1024
+IMAGE_HEADER_BYTES = 64 * 1024
+# Leading bytes of the formats PIL can decode; anything else is dropped on the first chunk
+IMAGE_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"GIF87a", b"GIF89a", b"RIFF", b"BM", b"II*\x00", b"MM\x00*")
+
+# Raw thumbnail bytes on disk, set IMAGE_CACHE_DIR="" to disable
+image_bytes_cache = DiskBlobCache(IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES) if IMAGE_CACHE_DIR else None
+
+RAPID_API_RATE = float(os.getenv("RAPID_API_RATE", "5"))
+RAPID_API_BURST = float(os.getenv("RAPID_API_BURST", "10"))
+RAPID_API_MAX_ATTEMPTS = int(os.getenv("RAPID_API_MAX_ATTEMPTS", "3"))
+RAPID_API_BACKOFF_CAP = float(os.getenv("RAPID_API_BACKOFF_CAP", "30"))
+RAPID_API_BREAKER_THRESHOLD = int(os.getenv("RAPID_API_BREAKER_THRESHOLD", "5"))
+RAPID_API_BREAKER_RESET = float(os.getenv("RAPID_API_BREAKER_RESET", "30"))
+
+OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+OPENAI_TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "200000"))
+OPENAI_MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "5"))
+OPENAI_EXPECTED_OUTPUT_TOKENS = 300
+
+# How images are encoded for the LLM (see ImagePolicy); LLM_IMAGE_MAX_SIZE=0 keeps the input size
+LLM_IMAGE_FORMAT = os.getenv("LLM_IMAGE_FORMAT", "JPEG")
+LLM_IMAGE_QUALITY = int(os.getenv("LLM_IMAGE_QUALITY", "85"))
+LLM_IMAGE_MAX_SIZE = int(os.getenv("LLM_IMAGE_MAX_SIZE", "0")) or None
+LLM_IMAGE_DETAIL = os.getenv("LLM_IMAGE_DETAIL", "auto")
+# Low detail images are downscaled to fit this box by the API, so larger uploads are wasted
+LOW_DETAIL_MAX_SIZE = 512
+
+# retry_on and throttle_on are filled in by get_openai_client, before the first call
+openai_governor = RequestGovernor(
+    requests_per_minute=OPENAI_REQUESTS_PER_MINUTE,
+    tokens_per_minute=OPENAI_TOKENS_PER_MINUTE,
+    retry_after=lambda e: openai_retry_after(e),
+    max_attempts=OPENAI_MAX_ATTEMPTS,
+)
+
+_openai_client = None
+_http_sessions = weakref.WeakKeyDictionary()
+_rate_limiters = {}
+_circuit_breakers = {}
+_semaphores = weakref.WeakKeyDictionary()
+_image_downloads = weakref.WeakKeyDictionary()
+
+
+def set_concurrency_limit(service: str, limit: int):
     """
-    Download an image from a URL and return as a PIL Image object
+    Change the concurrency cap for a service ("rapidapi", "downloads" or "openai").
+    Takes effect for event loops that have not used the service yet.
+    """
+    if service not in CONCURRENCY_LIMITS:
+        raise ValueError(f"Unknown service: {service}. Expected one of {list(CONCURRENCY_LIMITS)}")
+    CONCURRENCY_LIMITS[service] = limit
+
+
+def concurrency_limit(service: str) -> asyncio.Semaphore:
+    """
+    Return the semaphore limiting in-flight requests to `service` on the running loop.
+    """
+    loop_semaphores = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    if service not in loop_semaphores:
+        loop_semaphores[service] = asyncio.Semaphore(CONCURRENCY_LIMITS[service])
+    return loop_semaphores[service]
+
+
+def get_openai_client() -> "openai.AsyncOpenAI":
+    """
+    Return the shared OpenAI client, importing openai and creating it on first use.
+    """
+    global _openai_client
+    if _openai_client is None:
+        import openai
+
+        # Retries are handled by openai_governor so they respect the shared budgets
+        _openai_client = openai.AsyncOpenAI(api_key=get_settings().openai_api_key, max_retries=0)
+        openai_governor.retry_on = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+        openai_governor.throttle_on = (openai.RateLimitError,)
+    return _openai_client
+
+
+def get_http_session() -> "aiohttp.ClientSession":
+    """
+    Return the running loop's shared aiohttp session, creating it on first use.
+
+    The session keeps connections alive and caches DNS lookups so that
+    RapidAPI pagination and thumbnail downloads reuse the same TCP/TLS
+    connections. Sessions are bound to an event loop, so each loop (e.g.
+    each `asyncio.run` in its own thread) gets its own, and loops running
+    concurrently never replace each other's session.
+    """
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    session = _http_sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        )
+        session = _http_sessions[loop] = aiohttp.ClientSession(connector=connector)
+    return session
+
+
+async def close_http_session():
+    """
+    Close the running loop's shared aiohttp session, if it has one.
+    Sessions of other loops are left alone.
+    """
+    session = _http_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+@asynccontextmanager
+async def http_session_scope():
+    """
+    Context manager that closes the shared session when the block exits.
+    Wrap the body of an `asyncio.run` entry point with it.
+    """
+    try:
+        yield get_http_session()
+    finally:
+        await close_http_session()
+
+
+def media_cache_key(url: str) -> str:
+    """
+    Identity of a CDN media URL that survives re-signing: the path plus the
+    `stp` variant parameter, without host, expiry (`oe`) or signature (`oh`, `_nc_*`).
+    """
+    parts = urlsplit(url)
+    variant = parse_qs(parts.query).get("stp", [""])[0]
+    return make_cache_key(parts.path, variant)
+
+def media_url_expired(url: str) -> bool:
+    """
+    Whether a signed CDN URL's `oe` expiry (hex Unix time) has passed, or
+    will within MEDIA_URL_EXPIRY_MARGIN. URLs without `oe` never expire.
+    """
+    expiry = parse_qs(urlsplit(url).query).get("oe", [None])[0]
+    try:
+        return expiry is not None and int(expiry, 16) <= time.time() + MEDIA_URL_EXPIRY_MARGIN
+    except ValueError:
+        return False
+
+def media_url_usable(url: str) -> bool:
+    """
+    Whether the image at `url` can still be loaded: the URL has not expired,
+    or its bytes are in the image byte cache. Touches the disk; call off the loop.
+    """
+    return not media_url_expired(url) or (image_bytes_cache is not None and media_cache_key(url) in image_bytes_cache)
+
+def _has_image_signature(head: bytes) -> bool:
+    return head.startswith(IMAGE_SIGNATURES) and (not head.startswith(b"RIFF") or head[8:12] == b"WEBP")
+
+def _sniff_image_header(head: bytes) -> Optional[Tuple[str, Tuple[int, int]]]:
+    """
+    Return (format, size) parsed from the first bytes of an image, or None
+    if the header is not readable yet.
     """
+    try:
+        with Image.open(BytesIO(head)) as image:
+            return image.format, image.size
+    except Exception:
+        return None
+
+async def _fetch_image_bytes(url) -> Optional[bytes]:
+    """
+    Stream an image body, rejecting non-image content types, bodies larger
+    than IMAGE_MAX_BYTES and (non-JPEG) images above IMAGE_MAX_PIXELS, which
+    cannot be decoded at reduced size. The header is checked as soon as the
+    first chunk arrives so oversized or bogus bodies are dropped early. A
+    JPEG whose size marker lies past IMAGE_HEADER_BYTES (e.g. behind a large
+    ICC profile) is buffered in full and checked once complete.
+    """
+    import aiohttp
+
     try:
         timeout = aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url) as response:
+        session = get_http_session()
+        async with concurrency_limit("downloads"):
+            async with session.get(url, timeout=timeout) as response:
                 response.raise_for_status()
-                content = await response.read()
-                return Image.open(BytesIO(content))
+                if not response.content_type.startswith("image/"):
+                    raise ValueError(f"Unexpected content type: {response.content_type}")
+                if response.content_length and response.content_length > IMAGE_MAX_BYTES:
+                    raise ValueError(f"Image too large: {response.content_length} bytes")
+
+                content = bytearray()
+                header = None
+                async for chunk in response.content.iter_chunked(IMAGE_CHUNK_SIZE):
+                    content.extend(chunk)
+                    if len(content) > IMAGE_MAX_BYTES:
+                        raise ValueError(f"Image larger than {IMAGE_MAX_BYTES} bytes")
+                    # Sniff while the body is within IMAGE_HEADER_BYTES; past that, wait for all of it
+                    if header is None and len(content) - len(chunk) < IMAGE_HEADER_BYTES:
+                        if len(content) >= 12 and not _has_image_signature(bytes(content[:12])):
+                            raise ValueError("Body is not a decodable image")
+                        header = _sniff_image_header(bytes(content))
+                        if header is not None:
+                            image_format, (width, height) = header
+                            if image_format != "JPEG" and width * height > IMAGE_MAX_PIXELS:
+                                raise ValueError(f"Image too large to decode: {width}x{height}")
+                if header is None and _sniff_image_header(bytes(content)) is None:
+                    raise ValueError("Body is not a decodable image")
+                return bytes(content)
     except Exception as e:
-        print(f"Error downloading image from {url}: {e}")
+        logging.warning(f"Error downloading image from {url}: {e}")
         return None
 
-async def openai_response(
-    images: List[str], prompt, model: str = "gpt-4.1", use_web_search: bool = False
-) -> Tuple[dict, dict]:
+async def download_image_bytes(url, use_cache: bool = True) -> Optional[bytes]:
+    """
+    Download an image from a URL and return the raw bytes, or None on failure.
 
-    media_type = "image/png"
-    messages = []
+    With `use_cache`, bytes are looked up on disk by `media_cache_key` first
+    and concurrent downloads of the same media share one request.
+    """
+    with span("image.download", cache_hit=False, bytes=0) as download:
+        content = await _download_image_bytes(url, use_cache)
+        download.set(bytes=len(content) if content is not None else 0, failed=content is None)
+        return content
 
-    for image in images:
-        if isinstance(image, str):
+async def _download_image_bytes(url, use_cache: bool) -> Optional[bytes]:
+    if not use_cache:
+        return await _fetch_image_bytes(url)
+
+    key = media_cache_key(url)
+    if image_bytes_cache is not None:
+        content = await asyncio.to_thread(image_bytes_cache.get, key)
+        if content is not None:
+            set_attributes(cache_hit=True)
+            return content
+
+    in_flight = _image_downloads.setdefault(asyncio.get_running_loop(), {})
+    if key in in_flight:
+        set_attributes(coalesced=True)
+        return await asyncio.shield(in_flight[key])
+
+    task = asyncio.ensure_future(_fetch_image_bytes(url))
+    in_flight[key] = task
+    try:
+        content = await asyncio.shield(task)
+    finally:
+        in_flight.pop(key, None)
+    if content is not None and image_bytes_cache is not None:
+        await asyncio.to_thread(image_bytes_cache.set, key, content)
+    return content
+
+async def download_image(url):
+    """
+    Download an image from a URL and return as a PIL Image object
+    """
+    content = await download_image_bytes(url)
+    if content is None:
+        return None
+    try:
+        return Image.open(BytesIO(content))
+    except Exception as e:
+        logging.warning(f"Could not decode image from {url}: {e}")
+        return None
+
+@dataclass(frozen=True)
+class EncodedImage:
+    """
+    An image encoded once for the LLM and reusable across many requests.
+
+    Build it from a PIL image, a file path, or already-encoded bytes; the
+    base64 data URL is computed lazily and cached on the instance.
+    """
+    data: bytes
+    media_type: str = "image/png"
+
+    @classmethod
+    def from_pil(cls, image: Image.Image, format: str = "PNG") -> "EncodedImage":
+        buffered = BytesIO()
+        image.save(buffered, format=format)
+        return cls(buffered.getvalue(), Image.MIME[format.upper()])
+
+    @classmethod
+    def from_bytes(cls, data: bytes, media_type: str = None) -> "EncodedImage":
+        if media_type is None:
+            with Image.open(BytesIO(data)) as image:
+                media_type = Image.MIME.get(image.format, "image/png")
+        return cls(bytes(data), media_type)
+
+    @classmethod
+    def from_path(cls, path: str) -> "EncodedImage":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    @classmethod
+    def from_any(cls, image: Union[str, bytes, Image.Image, "EncodedImage"]) -> "EncodedImage":
+        if isinstance(image, EncodedImage):
+            return image
+        elif isinstance(image, str):
             # Handle file path
-            with open(image, "rb") as f:
-                encoded_image = base64.standard_b64encode(f.read()).decode("utf-8")
+            return cls.from_path(image)
+        elif isinstance(image, (bytes, bytearray)):
+            # Handle pre-encoded image bytes
+            return cls.from_bytes(image)
         elif isinstance(image, Image.Image):
             # Handle PIL Image object
-            buffered = BytesIO()
-            image.save(buffered, format="PNG")
-            encoded_image = base64.standard_b64encode(buffered.getvalue()).decode("utf-8")
-        else:
-            raise TypeError(f"Unsupported image type: {type(image)}. Expected str (file path) or PIL.Image.Image")
-
-        messages.append(
-            {
-                "type": "input_image",
-                "image_url": f"data:{media_type};base64,{encoded_image}",
-            }
+            return cls.from_pil(image)
+        raise TypeError(
+            f"Unsupported image type: {type(image)}. Expected str (file path), bytes, PIL.Image.Image or EncodedImage"
         )
 
+    @cached_property
+    def digest(self) -> str:
+        return hashlib.sha256(self.data).hexdigest()
+
+    @cached_property
+    def size(self) -> Tuple[int, int]:
+        with Image.open(BytesIO(self.data)) as image:
+            return image.size
+
+    @cached_property
+    def data_url(self) -> str:
+        encoded_image = base64.standard_b64encode(self.data).decode("utf-8")
+        return f"data:{self.media_type};base64,{encoded_image}"
+
+
+@dataclass(frozen=True)
+class ImagePolicy:
+    """
+    How images are sent to the LLM: encoding format and quality, the longest
+    side they are downscaled to (None keeps the input size) and the API
+    `detail` level ("low", "high" or "auto").
+    """
+    format: str = "PNG"
+    quality: Optional[int] = None
+    max_size: Optional[int] = None
+    detail: str = "auto"
+
+    @classmethod
+    def default(cls) -> "ImagePolicy":
+        return cls(format=LLM_IMAGE_FORMAT, quality=LLM_IMAGE_QUALITY, max_size=LLM_IMAGE_MAX_SIZE, detail=LLM_IMAGE_DETAIL)
+
+    def with_detail(self, detail: str) -> "ImagePolicy":
+        """
+        Same policy at another detail level; low detail also caps the size at
+        LOW_DETAIL_MAX_SIZE since the API discards anything larger.
+        """
+        max_size = self.max_size
+        if detail == "low":
+            max_size = min(max_size or LOW_DETAIL_MAX_SIZE, LOW_DETAIL_MAX_SIZE)
+        return replace(self, detail=detail, max_size=max_size)
+
+    @property
+    def encoding(self) -> Tuple[str, Optional[int], Optional[int]]:
+        """The fields that determine the encoded bytes; `detail` only affects the request."""
+        return self.format, self.quality, self.max_size
+
+    def encode(self, image: Union[str, bytes, Image.Image, EncodedImage]) -> EncodedImage:
+        """
+        Encode an image under this policy. Already-encoded images that match
+        the format and size limit are passed through untouched.
+        """
+        media_type = Image.MIME.get(self.format.upper(), f"image/{self.format.lower()}")
+        if not isinstance(image, Image.Image):
+            encoded = EncodedImage.from_any(image)
+            if encoded.media_type == media_type and (self.max_size is None or max(encoded.size) <= self.max_size):
+                return encoded
+            image = Image.open(BytesIO(encoded.data))
+        if self.max_size is not None and max(image.size) > self.max_size:
+            image = image.copy()
+            image.thumbnail((self.max_size, self.max_size), Image.Resampling.LANCZOS)
+        if self.format.upper() == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        buffered = BytesIO()
+        options = {"quality": self.quality} if self.quality is not None else {}
+        image.save(buffered, format=self.format, **options)
+        return EncodedImage(buffered.getvalue(), media_type)
+
+
+async def encode_images(
+    images: List[Union[str, bytes, Image.Image, EncodedImage]], policy: ImagePolicy = None
+) -> List[EncodedImage]:
+    """
+    Encode images off the event loop so they can be shared across LLM calls.
+    Without a policy, images are encoded as-is (PIL images as PNG).
+    """
+    def encode(image):
+        encoded = policy.encode(image) if policy is not None else EncodedImage.from_any(image)
+        encoded.data_url  # warm the cached base64 data URL off the event loop
+        return encoded
+
+    return list(await asyncio.gather(*[asyncio.to_thread(encode, image) for image in images]))
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Estimate the input tokens of a high-detail image: scale to fit 2048x2048,
+    then the shortest side to 768, and count 512px tiles.
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * tiles
+
+
+def estimate_input_tokens(
+    images: List[Union[str, bytes, Image.Image, EncodedImage]], prompt: str, detail: str = None
+) -> int:
+    """
+    Rough input-token estimate for a request: images plus ~4 characters per prompt token.
+    Low detail images cost a flat 85 tokens.
+    """
+    tokens = len(prompt) // 4
+    for image in images:
+        if detail == "low":
+            tokens += 85
+            continue
+        width, height = image.size if isinstance(image, (Image.Image, EncodedImage)) else (2048, 2048)
+        tokens += estimate_image_tokens(width, height)
+    return tokens
+
+
+def openai_retry_after(error: Exception) -> float:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    return parse_retry_after(response.headers.get("retry-after"))
+
+
+async def openai_response(
+    images: List[Union[str, bytes, Image.Image, EncodedImage]],
+    prompt,
+    model: str = "gpt-4.1",
+    use_web_search: bool = False,
+    response_schema: dict = None,
+    schema_name: str = "response",
+    detail: str = None,
+) -> str:
+    """
+    Send images and a prompt to the Responses API and return the output text.
+    With `response_schema`, the output is constrained to that JSON schema
+    (strict structured outputs), so it can be parsed with json.loads directly.
+    `detail` ("low", "high" or "auto") sets the image detail level; encode
+    images with a matching ImagePolicy to avoid uploading unused pixels.
+    """
+    messages = []
+
+    for image in images:
+        encoded = EncodedImage.from_any(image)
+        message = {
+            "type": "input_image",
+            "image_url": encoded.data_url,
+        }
+        if detail is not None:
+            message["detail"] = detail
+        messages.append(message)
+
     messages.append({"type": "input_text", "text": prompt})
+    request = {"model": model, "input": [{"role": "user", "content": messages}]}
     if use_web_search:
-        response = await openai_client.responses.create(
-            model=model, input=[{"role": "user", "content": messages}],
-            tools=[{"type": "web_search_preview", "search_context_size": "low"}]
-        )
+        request["tools"] = [{"type": "web_search_preview", "search_context_size": "low"}]
+    if response_schema is not None:
+        request["text"] = {
+            "format": {"type": "json_schema", "name": schema_name, "schema": response_schema, "strict": True}
+        }
+
+    with span(
+        "llm.call",
+        model=model,
+        schema=schema_name,
+        images=len(images),
+        detail=detail,
+        bytes=sum(len(part.get("image_url", "")) for part in messages),
+        retries=0,
+    ) as call:
+        client = get_openai_client()
+
+        async def create():
+            call.add("attempts")
+            async with concurrency_limit("openai"):
+                return await client.responses.create(**request)
+
+        estimated_tokens = estimate_input_tokens(images, prompt, detail) + OPENAI_EXPECTED_OUTPUT_TOKENS
+        response = await openai_governor.run(create, tokens=estimated_tokens)
+        call.set(retries=call.attributes["attempts"] - 1)
+        if getattr(response, "usage", None) is not None:
+            openai_governor.settle(estimated_tokens, response.usage.total_tokens)
+            record_usage(model, schema_name, response.usage)
+            call.set(
+                input_tokens=response.usage.input_tokens,
+                output_tokens=response.usage.output_tokens,
+                total_tokens=response.usage.total_tokens,
+            )
+
         return response.output_text
-    else:
-        response = await openai_client.responses.create(
-            model=model, input=[{"role": "user", "content": messages}]
+
+def rapid_api_rate_limiter(host: str) -> TokenBucket:
+    """
+    Return the token bucket shared by every request to `host`.
+    """
+    if host not in _rate_limiters:
+        _rate_limiters[host] = TokenBucket(rate=RAPID_API_RATE, burst=RAPID_API_BURST)
+    return _rate_limiters[host]
+
+
+def rapid_api_circuit_breaker(host: str) -> CircuitBreaker:
+    """
+    Return the circuit breaker shared by every request to `host`.
+    """
+    if host not in _circuit_breakers:
+        _circuit_breakers[host] = CircuitBreaker(
+            failure_threshold=RAPID_API_BREAKER_THRESHOLD, reset_timeout=RAPID_API_BREAKER_RESET
         )
+    return _circuit_breakers[host]
 
-    return response.output_text
 
-async def call_rapid_api(url: str, params: dict, headers: dict) -> dict:
-    tries = 3
-    async with aiohttp.ClientSession() as session:
-        while tries > 0:
-            logging.info(f"API call, {tries} tries left")
-            async with session.get(url, headers=headers, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
+async def call_rapid_api(url: str, params: dict, headers: dict, cache_ttl: float = None) -> dict:
+    """
+    GET a RapidAPI endpoint and return the decoded JSON.
+
+    Requests are paced by a per-host token bucket. 429, 408, 5xx and
+    connection errors are retried with exponential backoff and jitter,
+    honoring Retry-After. Repeated upstream failures open a per-host
+    circuit breaker so callers fail fast with CircuitOpenError.
+
+    When `cache_ttl` is given, successful responses are cached by endpoint
+    and params (headers, including the API key, are not part of the key) and
+    served from `rapid_api_cache` while younger than `cache_ttl` seconds.
+    """
+    with span("rapidapi.request", endpoint=urlsplit(url).path, cache_hit=False, retries=0):
+        return await _call_rapid_api(url, params, headers, cache_ttl)
+
+async def _call_rapid_api(url: str, params: dict, headers: dict, cache_ttl: float = None) -> dict:
+    import aiohttp
+
+    cache_key = None
+    if cache_ttl:
+        cache_key = make_cache_key(url, json.dumps(params, sort_keys=True, default=str))
+        cached = await rapid_api_cache.get(cache_key, ttl=cache_ttl)
+        if cached is not None:
+            logging.info(f"API cache hit: {url}")
+            set_attributes(cache_hit=True)
+            return cached
+
+    host = urlsplit(url).netloc
+    limiter = rapid_api_rate_limiter(host)
+    breaker = rapid_api_circuit_breaker(host)
+    session = get_http_session()
+    status = None
+    for attempt in range(RAPID_API_MAX_ATTEMPTS):
+        logging.info(f"API call, {RAPID_API_MAX_ATTEMPTS - attempt} tries left")
+        set_attributes(retries=attempt)
+        trial = breaker.check(host)
+        try:
+            await limiter.acquire()
+            retry_after = None
+            try:
+                async with concurrency_limit("rapidapi"):
+                    async with session.get(url, headers=headers, params=params) as response:
+                        status = response.status
+                        set_attributes(status=status, bytes=response.content_length or 0)
+                        if status == 200:
+                            data = await response.json()
+                        else:
+                            content = await response.text()
+                            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.error(f"RapidAPI request error: {e!r}")
+                status = None
+                breaker.record_failure()
+            else:
+                if status == 200:
+                    breaker.record_success()
+                    # Error payloads are returned with a 200 status, don't cache them
+                    if cache_key and data and not (isinstance(data, dict) and data.get("exc_type")):
+                        await rapid_api_cache.set(cache_key, data)
                     return data
-                elif response.status == 404:
-                    raise Exception(f"Page Not Found: {response.status}")
+                logging.error(f"status_code:{status}:{content}")
+                if status == 429 or (status != 408 and status < 500):
+                    # The host answered: throttling or a rejected request is not an outage
+                    breaker.record_success()
                 else:
-                    content = await response.text()
-                    logging.error(f"status_code:{response.status}:{content}")
-                    tries -= 1
-                    continue
-        if tries == 0:
-            raise Exception(f"Failed 3 Attempts : {response.status}")
\ No newline at end of file
+                    breaker.record_failure()
+                if status == 404:
+                    raise Exception(f"Page Not Found: {status}")
+                if status != 429 and status != 408 and status < 500:
+                    raise Exception(f"RapidAPI request failed: {status}")
+        finally:
+            if trial:
+                # No-op once an outcome was recorded; frees the slot if the trial was cancelled
+                breaker.release_trial()
+
+        if attempt + 1 < RAPID_API_MAX_ATTEMPTS:
+            delay = retry_after if retry_after is not None else backoff_delay(attempt, cap=RAPID_API_BACKOFF_CAP)
+            delay = min(delay, RAPID_API_BACKOFF_CAP)
+            if status == 429:
+                # Throttled: hold back every caller sharing this host, the next acquire waits
+                limiter.pause(delay)
+            else:
+                await asyncio.sleep(delay)
+
+    raise Exception(f"Failed {RAPID_API_MAX_ATTEMPTS} Attempts : {status}")
@@ -0,0 +1,130 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from src.clients import http_session_scope
+from src.settings import load_env
+
+load_env()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Seconds a finished job stays available for polling
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+
+
+@dataclass
+class Job:
+    id: str
+    key: str
+    status: str = "queued"  # queued, running, done or failed
+    progress: int = 0
+    message: str = "Queued"
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+
+class JobProgress:
+    """
+    Progress sink with the same methods as Streamlit's progress bar and
+    status text, so pipeline code written against those can report into a job.
+    """
+
+    def __init__(self, job: Job):
+        self.job = job
+
+    def progress(self, value: int):
+        self.job.progress = int(value)
+
+    def text(self, message: str):
+        self.job.message = message
+
+
+class JobQueue:
+    """
+    Runs jobs on a single background event loop with `workers` concurrent
+    workers and one pooled HTTP session, so many callers (e.g. Streamlit
+    sessions) share connections, caches and rate limits instead of each
+    starting their own loop.
+
+    `runner(progress, *args)` does the work and reports through a JobProgress.
+    Submitting a key that is already queued or running returns the existing job.
+    """
+
+    def __init__(self, runner: Callable[..., Awaitable[Any]], workers: int = JOB_WORKERS):
+        self.runner = runner
+        self.workers = workers
+        self._jobs: Dict[str, Job] = {}
+        self._in_flight: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop = None
+        self._queue = None
+        self._thread = threading.Thread(target=asyncio.run, args=(self._serve(),), name="job-queue", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._ready.set()
+        async with http_session_scope():
+            await asyncio.gather(*[self._work() for _ in range(self.workers)])
+
+    async def _work(self):
+        while True:
+            job, args = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = await self.runner(JobProgress(job), *args)
+                job.status = "done"
+            except Exception as e:
+                logging.error(f"Job {job.id} ({job.key}) failed: {e}")
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                with self._lock:
+                    self._in_flight.pop(job.key, None)
+
+    def submit(self, key: str, *args) -> Job:
+        """Queue a job for `key`, or return the one already in flight."""
+        with self._lock:
+            self._prune()
+            job = self._in_flight.get(key)
+            if job is not None:
+                return job
+            job = Job(id=uuid.uuid4().hex, key=key)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (job, args))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> int:
+        """Number of queued jobs submitted before `job`."""
+        with self._lock:
+            return sum(
+                other.status == "queued" and other.created_at < job.created_at
+                for other in self._in_flight.values()
+            )
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
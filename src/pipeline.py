@@ -0,0 +1,118 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from src.batch import ProfileInput, normalize_profile
+from src.pricing import fetch_profile, build_collages, analyze_collages, finish_pricing
+from src.settings import load_env
+
+load_env()
+
+# Workers per pipeline stage; size each to what its upstream dependency sustains
+STAGE_WORKERS = {
+    "fetch": int(os.getenv("PIPELINE_FETCH_WORKERS", "4")),
+    "collages": int(os.getenv("PIPELINE_COLLAGE_WORKERS", "4")),
+    "analysis": int(os.getenv("PIPELINE_ANALYSIS_WORKERS", "8")),
+}
+# Profiles buffered between stages; keeps memory bounded and applies backpressure
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+
+
+async def iter_pipelined_pricing(
+    profiles: Iterable[ProfileInput],
+    stage_workers: Dict[str, int] = None,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    analysis_mode: str = "separate",
+    group_size: int = None,
+    refresh_cache: bool = False,
+    incremental: bool = False,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Price many profiles through a staged pipeline and yield one record per
+    profile as soon as it completes, in the same format as iter_pricing.
+
+    RapidAPI fetches, collage building and LLM analysis each run in their own
+    pool of workers, connected by bounded queues, so while one profile is
+    being analyzed the next one's thumbnails download and the one after that
+    is fetched. Throughput tracks the slowest stage rather than the sum of
+    all stage latencies.
+    """
+    workers = STAGE_WORKERS | (stage_workers or {})
+
+    async def fetch(item):
+        page_url, page_name = item["page_url"], item["page_name"]
+        return await fetch_profile(page_url, page_name, incremental=incremental)
+
+    async def collages(ctx):
+        return await build_collages(ctx, refresh_cache=refresh_cache)
+
+    async def analysis(ctx):
+        ctx = await analyze_collages(ctx, analysis_mode=analysis_mode, group_size=group_size, refresh_cache=refresh_cache)
+        return ctx | {"result": await finish_pricing(ctx)}
+
+    stages: List[Tuple[str, Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]]] = [
+        ("fetch", fetch),
+        ("collages", collages),
+        ("analysis", analysis),
+    ]
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    done = object()
+
+    async def feed():
+        for profile in profiles:
+            try:
+                page_url, page_name = normalize_profile(profile)
+            except ValueError as e:
+                await queues[-1].put({"profile": profile, "error": str(e)})
+                continue
+            await queues[0].put({"page_url": page_url, "page_name": page_name, "started": time.perf_counter()})
+        for _ in range(workers[stages[0][0]]):
+            await queues[0].put(done)
+
+    async def run_stage(index: int, name: str, func, remaining: List[int]):
+        inbox, outbox = queues[index], queues[index + 1]
+        while True:
+            item = await inbox.get()
+            if item is done:
+                # The last worker out of a stage tells every worker of the next one
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    next_workers = workers[stages[index + 1][0]] if index + 1 < len(stages) else 1
+                    for _ in range(next_workers):
+                        await outbox.put(done)
+                return
+            if "result" not in item and "error" not in item:
+                try:
+                    # Merge so bookkeeping fields (e.g. "started") survive each stage
+                    item = item | await func(item)
+                except Exception as e:
+                    logging.error(f"Pricing stage {name} failed for {item['page_url']}: {e}")
+                    item = item | {"error": str(e)}
+            await outbox.put(item)
+
+    tasks = [asyncio.create_task(feed())]
+    for index, (name, func) in enumerate(stages):
+        remaining = [workers[name]]
+        tasks += [asyncio.create_task(run_stage(index, name, func, remaining)) for _ in range(workers[name])]
+
+    try:
+        while True:
+            item = await queues[-1].get()
+            if item is done:
+                break
+            if "profile" in item:
+                yield item
+                continue
+            record = {"page_url": item["page_url"], "page_name": item["page_name"]}
+            if "result" in item:
+                record["pricing"] = item["result"]
+            else:
+                record["error"] = item["error"]
+            record["elapsed_seconds"] = round(time.perf_counter() - item["started"], 3)
+            yield record
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
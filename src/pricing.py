@@ -1,8 +1,18 @@
-from src.services.rapidapi import get_instagram_page_info, get_instagram_post_info
-from src.agents import analyze_asset
-from src.utils import create_collage_from_urls
+from src.rate_card import get_rate_card
+from src.tracing import span, traced
+from src.usage import track_usage
+from src.state import ANALYSIS_REUSE_OVERLAP, load_profile_state, save_profile_state, merge_posts, thumbnail_overlap
 import logging
 import asyncio
+from bisect import bisect_right
+from typing import TYPE_CHECKING, Sequence, Union
+
+import numpy as np
+
+# The stages import RapidAPI, OpenAI, image and pandas code on first use, so
+# importing classify_pricing alone stays cheap
+if TYPE_CHECKING:
+    import pandas as pd
 
 logging.getLogger().setLevel(logging.INFO)
 
@@ -23,76 +33,23 @@ def classify_pricing(follower_count: int, engagement_rate: float, content_type:
     if engagement_rate > 10:
         engagement_rate = engagement_rate / 100
     
-    # Define pricing structure based on the image and notebook analysis
-    if content_type.lower() == 'premium':
-        pricing_matrix = {
-            # Format: (follower_min, follower_max, engagement_min, engagement_max): (internal_cost, pitching_cost, tier)
-            (0, 100000, 0, 1): (700, 1200, "Premium Basic Low Engagement"),
-            (0, 100000, 1, 5): (1200, 1500, "Premium Basic Medium Engagement"),
-            (0, 100000, 5, 100): (1500, 2000, "Premium Basic High Engagement"),
-            
-            (100000, 500000, 0, 1): (2000, 2500, "Premium Mid Low Engagement"),
-            (100000, 500000, 1, 5): (2500, 3000, "Premium Mid Medium Engagement"),
-            (100000, 500000, 5, 100): (3000, 4000, "Premium Mid High Engagement"),
-            
-            (500000, 1000000, 0, 1): (2500, 3000, "Premium Large Low Engagement"),
-            (500000, 1000000, 1, 5): (3000, 5000, "Premium Large Medium Engagement"),
-            (500000, 1000000, 5, 100): (5000, 8500, "Premium Large High Engagement"),
-            
-            (1000000, 2500000, 0, 1): (7000, 15000, "Premium Mega Low Engagement"),
-            (1000000, 2500000, 1, 5): (15000, 25000, "Premium Mega Medium Engagement"),
-            (1000000, 2500000, 5, 100): (25000, 35000, "Premium Mega High Engagement"),
-            
-            (2500000, 5000000, 0, 1): (15000, 25000, "Premium Ultra Low Engagement"),
-            (2500000, 5000000, 1, 5): (25000, 35000, "Premium Ultra Medium Engagement"),
-            (2500000, 5000000, 5, 100): (35000, 75000, "Premium Ultra High Engagement"),
-            
-            (5000000, float('inf'), 0, 1): (25000, 35000, "Premium Celebrity Low Engagement"),
-            (5000000, float('inf'), 1, 5): (35000, 75000, "Premium Celebrity Medium Engagement"),
-            (5000000, float('inf'), 5, 100): (75000, 150000, "Premium Celebrity High Engagement"),
-        }
-    
-    else:  # mass-meme or general
-        pricing_matrix = {
-            # Format: (follower_min, follower_max, engagement_min, engagement_max): (internal_cost, pitching_cost, tier)
-            (0, 100000, 0, 1): (150, 200, "General Basic Low Engagement"),
-            (0, 100000, 1, 5): (200, 300, "General Basic Medium Engagement"),
-            (0, 100000, 5, 100): (300, 400, "General Basic High Engagement"),
-            
-            (100000, 500000, 0, 1): (400, 600, "General Mid Low Engagement"),
-            (100000, 500000, 1, 5): (600, 800, "General Mid Medium Engagement"),
-            (100000, 500000, 5, 100): (800, 1200, "General Mid High Engagement"),
-            
-            (500000, 1000000, 0, 1): (1000, 1500, "General Large Low Engagement"),
-            (500000, 1000000, 1, 5): (1500, 2000, "General Large Medium Engagement"),
-            (500000, 1000000, 5, 100): (2500, 3500, "General Large High Engagement"),
-            
-            (1000000, 2500000, 0, 1): (2000, 3000, "General Mega Low Engagement"),
-            (1000000, 2500000, 1, 5): (3500, 5000, "General Mega Medium Engagement"),
-            (1000000, 2500000, 5, 100): (6000, 8000, "General Mega High Engagement"),
-            
-            (2500000, 5000000, 0, 1): (5000, 7000, "General Ultra Low Engagement"),
-            (2500000, 5000000, 1, 5): (8000, 10000, "General Ultra Medium Engagement"),
-            (2500000, 5000000, 5, 100): (12000, 15000, "General Ultra High Engagement"),
-            
-            (5000000, float('inf'), 0, 1): (10000, 15000, "General Celebrity Low Engagement"),
-            (5000000, float('inf'), 1, 5): (15000, 20000, "General Celebrity Medium Engagement"),
-            (5000000, float('inf'), 5, 100): (25000, 30000, "General Celebrity High Engagement"),
-        }
+    # Premium or mass-meme/general pricing from the precompiled rate card
+    rate_card = get_rate_card()
+    pricing = rate_card.resolve(content_type)
     
     # Find matching price tier
-    for (f_min, f_max, e_min, e_max), (internal_cost, pitching_cost, tier) in pricing_matrix.items():
-        if (f_min <= follower_count < f_max and 
-            e_min <= engagement_rate < e_max):
-            
-            return {
-                "price_tier": tier,
-                "min_cost_estimate": internal_cost,  # Min price
-                "max_cost_estimate": pitching_cost,  # Max price
-                "follower_range": f"{f_min:,}-{f_max:,}" if f_max != float('inf') else f"{f_min:,}+",
-                "engagement_range": f"{e_min}-{e_max}%",
-                "content_type": content_type,
-            }
+    i = bisect_right(pricing["follower_edges"], follower_count) - 1
+    j = bisect_right(pricing["engagement_edges"], engagement_rate) - 1
+    if 0 <= i < len(pricing["tiers"]) and 0 <= j < len(pricing["tiers"][0]):
+        return {
+            "price_tier": pricing["tiers"][i, j],
+            "min_cost_estimate": int(pricing["min_costs"][i, j]),  # Min price
+            "max_cost_estimate": int(pricing["max_costs"][i, j]),  # Max price
+            "follower_range": pricing["follower_ranges"][i],
+            "engagement_range": pricing["engagement_ranges"][j],
+            "content_type": content_type,
+            "rate_card_version": rate_card.version,
+        }
     
     # Default case if no match found
     return {
@@ -102,47 +59,169 @@ def classify_pricing(follower_count: int, engagement_rate: float, content_type:
         "follower_range": "Unknown",
         "engagement_range": "Unknown", 
         "content_type": content_type,
+        "rate_card_version": rate_card.version,
         "error": "No matching price tier found for given parameters"
     }
 
 
-async def get_pricing_from_instagram(page_url: str, page_name: str) -> dict:
+def classify_pricing_batch(
+    follower_counts: Union[Sequence[float], np.ndarray, "pd.Series"],
+    engagement_rates: Union[Sequence[float], np.ndarray, "pd.Series"],
+    content_types: Union[str, Sequence[str], np.ndarray, "pd.Series"],
+) -> "pd.DataFrame":
+    """
+    Vectorized classify_pricing over arrays of profiles.
+
+    Tiers are resolved with np.searchsorted over the rate card's precompiled
+    bin edges. `content_types` may be a single string applied to every row.
+
+    Returns:
+        pd.DataFrame with one row per profile and the classify_pricing keys as
+        columns; unmatched rows get "Unclassified" and a non-null "error".
+    """
+    import pandas as pd
+
+    follower_counts = np.asarray(follower_counts, dtype=float)
+    engagement_rates = np.asarray(engagement_rates, dtype=float)
+    engagement_rates = np.where(engagement_rates > 10, engagement_rates / 100, engagement_rates)
+    if isinstance(content_types, str):
+        content_types = np.full(follower_counts.shape, content_types, dtype=object)
+    content_types = pd.Series(content_types, dtype=object).reset_index(drop=True)
+    rate_card = get_rate_card()
+    resolved = content_types.fillna("").str.lower()
+    resolved = resolved.where(resolved.isin(rate_card.pricing.keys()), rate_card.default_content_type).to_numpy()
+
+    n = len(follower_counts)
+    result = pd.DataFrame({
+        "price_tier": np.full(n, "Unclassified", dtype=object),
+        "min_cost_estimate": np.zeros(n, dtype=np.int64),
+        "max_cost_estimate": np.zeros(n, dtype=np.int64),
+        "follower_range": np.full(n, "Unknown", dtype=object),
+        "engagement_range": np.full(n, "Unknown", dtype=object),
+        "content_type": content_types,
+        "rate_card_version": rate_card.version,
+        "error": np.full(n, "No matching price tier found for given parameters", dtype=object),
+    })
+
+    for key, pricing in rate_card.pricing.items():
+        rows = resolved == key
+        if not rows.any():
+            continue
+        i = np.searchsorted(pricing["follower_edges"], follower_counts, side="right") - 1
+        j = np.searchsorted(pricing["engagement_edges"], engagement_rates, side="right") - 1
+        n_f, n_e = pricing["tiers"].shape
+        matched = rows & (i >= 0) & (i < n_f) & (j >= 0) & (j < n_e)
+        i, j = i[matched], j[matched]
+        result.loc[matched, "price_tier"] = pricing["tiers"][i, j]
+        result.loc[matched, "min_cost_estimate"] = pricing["min_costs"][i, j]
+        result.loc[matched, "max_cost_estimate"] = pricing["max_costs"][i, j]
+        result.loc[matched, "follower_range"] = pricing["follower_ranges"][i]
+        result.loc[matched, "engagement_range"] = pricing["engagement_ranges"][j]
+        result.loc[matched, "error"] = None
+
+    return result
+
+
+@traced("stage.fetch_profile")
+async def fetch_profile(page_url: str, page_name: str, incremental: bool = False) -> dict:
+    """
+    Pricing stage 1 (RapidAPI): fetch page info and recent posts, and compute
+    engagement and thumbnail URLs. Returns the context for the later stages;
+    `ctx["result"]` is set when pricing ended early with an error.
+    """
+    from src.clients import media_cache_key, media_url_usable
+    from src.services.rapidapi import get_instagram_page_info, get_instagram_post_info, extract_thumbnail_urls
+    from src.utils import THUMBNAIL_BACKFILL_POSTS
+
+    # Engagement is measured on the latest 27 posts; the rest backfill near-duplicate thumbnails
+    n_posts = 27 + THUMBNAIL_BACKFILL_POSTS
+    ctx = {"page_url": page_url, "page_name": page_name, "incremental": incremental}
     page_info = await get_instagram_page_info(page_url)
     if not page_info:
         logging.warning(f"No page info found for {page_url}")
-        return {"error": "No page info found", "page_url": page_url}
+        return ctx | {"result": {"error": "No page info found", "page_url": page_url}}
 
-    post_array, raw_post_array = await get_instagram_post_info(page_info["platform_specific_info"]["pk"], n_posts=27)
+    profile_id = page_info["platform_specific_info"]["pk"]
+    state = await load_profile_state(profile_id) if incremental else None
+    if state and state.get("last_taken_at"):
+        new_posts, _ = await get_instagram_post_info(
+            profile_id, n_posts=n_posts, exact=True, keep_raw=False, slim=True, since=state["last_taken_at"]
+        )
+        post_array = merge_posts(new_posts, state["posts"], n_posts)
+        logging.info(f"Incremental fetch: {len(new_posts)} new posts for {page_url}")
+    else:
+        post_array, _ = await get_instagram_post_info(
+            profile_id, n_posts=n_posts, exact=True, keep_raw=False, slim=True
+        )
+        new_posts = post_array
     follower_count = page_info["follower_count"]
 
-    engagement_rate = sum([post["like_count"] + post["comment_count"] + post.get("view_count", 0) for post in post_array]) / follower_count
+    engagement_rate = sum([post["like_count"] + post["comment_count"] + post.get("view_count", 0) for post in post_array[:27]]) / follower_count
     logging.info(f"Engagement rate: {engagement_rate}")
 
     if not post_array:
         logging.warning(f"No posts found for {page_url}")
-        return {"error": "No posts found", "page_url": page_url}
+        return ctx | {"result": {"error": "No posts found", "page_url": page_url}}
 
     # Extract image URLs from posts
-    image_urls = []
-    for post in post_array:
-        if post.get("media_list"):
-            for media in post["media_list"]:
-                if media.get('type') in ['thumbnail', 'image'] and media.get('url'):
-                    image_urls.append(media.get('url'))
-                    break
+    image_urls = extract_thumbnail_urls(post_array)
 
     if not image_urls:
         logging.warning(f"No images found for {page_url}")
-        return {"error": "No images found", "page_url": page_url}
-    
+        return ctx | {"result": {"error": "No images found", "page_url": page_url}}
+
+    thumbnail_keys = [media_cache_key(url) for url in image_urls[:27]]
+    stale_thumbnails = 0
+    if state:
+        # Cached posts carry signed URLs that expire; only keep those whose bytes are still
+        # on disk, so collages backfill from loadable posts instead of silently shrinking
+        usable = await asyncio.to_thread(lambda: [media_url_usable(url) for url in image_urls])
+        stale_thumbnails = usable.count(False)
+        if stale_thumbnails:
+            logging.warning(f"{stale_thumbnails} cached thumbnails of {page_url} expired and are no longer cached")
+            image_urls = [url for url, ok in zip(image_urls, usable) if ok]
+    return ctx | {
+        "profile_id": profile_id,
+        "state": state,
+        "post_array": post_array,
+        "new_posts": new_posts,
+        "follower_count": follower_count,
+        "engagement_rate": engagement_rate,
+        "image_urls": image_urls,
+        "thumbnail_keys": thumbnail_keys,
+        "stale_thumbnails": stale_thumbnails,
+    }
+
+
+@traced("stage.build_collages")
+async def build_collages(ctx: dict, refresh_cache: bool = False) -> dict:
+    """
+    Pricing stage 2 (image downloads): build up to 3 collages of 9 distinct
+    thumbnails, unless the previous analysis can be reused. Near-duplicate
+    thumbnails are dropped and backfilled from later posts, so repost-heavy
+    pages get fewer, more informative collages.
+    """
+    from src.utils import create_collage_from_urls, select_distinct_thumbnails
+
+    state, image_urls = ctx["state"], ctx["image_urls"]
+    analysis_reused = bool(
+        state
+        and state.get("analysis")
+        and not refresh_cache
+        and thumbnail_overlap(state.get("thumbnail_keys"), ctx["thumbnail_keys"]) >= ANALYSIS_REUSE_OVERLAP
+    )
+
     collages = []
-    if image_urls:
+    if image_urls and not analysis_reused:
+        contents = {}
+        image_urls = await select_distinct_thumbnails(image_urls, limit=27, contents=contents)
         tasks = []
-        for i in range(0, min(len(image_urls), 27), 9):
+        for i in range(0, len(image_urls), 9):
             tasks.append(create_collage_from_urls(
                 image_urls[i:i+9],
                 width=900,
-                height=900
+                height=900,
+                contents=contents,
             ))
         
         results = await asyncio.gather(*tasks, return_exceptions=True)
@@ -151,38 +230,110 @@ async def get_pricing_from_instagram(page_url: str, page_name: str) -> dict:
                 logging.warning(f"Failed to create collage: {result}")
             else:
                 collages.append(result)
-    
-    # Max 3 collages * 9 images
-    if collages:
-        try:
-            analysis = await analyze_asset(page_name,collages)
-            if "pricing" in analysis:
-                content_category = analysis["pricing"].get("category", "general")
-            else:
-                logging.warning(f"No pricing analysis found for {page_url}")
-                content_category = "general"
-        except Exception as e:
-            logging.warning(f"Classification failed: {e}")
-
     logging.info(f"Collages created: {len(collages)}")
+    return ctx | {"collages": collages, "analysis_reused": analysis_reused}
+
+
+@traced("stage.analyze_collages")
+async def analyze_collages(
+    ctx: dict, analysis_mode: str = "separate", group_size: int = None, refresh_cache: bool = False
+) -> dict:
+    """
+    Pricing stage 3 (LLM): analyze the collages, or carry over the reused analysis.
+    """
+    from src.agents import analyze_asset
 
+    # Max 3 collages * 9 images
+    analysis = ctx["state"]["analysis"] if ctx["analysis_reused"] else {}
+    with track_usage() as usage:
+        if ctx["collages"]:
+            try:
+                analysis = await analyze_asset(
+                    ctx["page_name"], ctx["collages"], mode=analysis_mode, group_size=group_size, refresh_cache=refresh_cache
+                )
+            except Exception as e:
+                logging.warning(f"Classification failed: {e}")
     logging.info(f"Analysis: {analysis}")
+    # Collages are no longer needed; drop them before the context moves on
+    return ctx | {"analysis": analysis, "collages": [], "usage": usage.summary()}
 
-    return classify_pricing(follower_count, engagement_rate, content_category) | {"brand_analysis": analysis}
+
+@traced("stage.finish_pricing")
+async def finish_pricing(ctx: dict) -> dict:
+    """
+    Pricing stage 4: classify the price and persist incremental state.
+    """
+    analysis, state = ctx["analysis"], ctx["state"]
+    content_category = "general"
+    if "pricing" in analysis:
+        content_category = analysis["pricing"].get("category") or "general"
+    else:
+        logging.warning(f"No pricing analysis found for {ctx['page_url']}")
+
+    with span("pricing.classify", content_type=content_category):
+        pricing = classify_pricing(ctx["follower_count"], ctx["engagement_rate"], content_category)
+    pricing = pricing | {"brand_analysis": analysis, "usage": ctx["usage"]}
+    if ctx["incremental"]:
+        analysis_ok = "pricing" in analysis and not analysis["pricing"].get("error")
+        await save_profile_state(
+            ctx["profile_id"],
+            ctx["post_array"],
+            ctx["thumbnail_keys"] if analysis_ok else (state or {}).get("thumbnail_keys", []),
+            analysis if analysis_ok else (state or {}).get("analysis"),
+        )
+        pricing["incremental"] = {
+            "new_posts": len(ctx["new_posts"]),
+            "analysis_reused": ctx["analysis_reused"],
+            # Expired cached thumbnails left out of the collages
+            "stale_thumbnails": ctx["stale_thumbnails"],
+        }
+    return pricing
+
+
+async def get_pricing_from_instagram(
+    page_url: str,
+    page_name: str,
+    analysis_mode: str = "separate",
+    group_size: int = None,
+    refresh_cache: bool = False,
+    incremental: bool = False,
+) -> dict:
+    """
+    Price an Instagram profile from its follower count, recent engagement and
+    an LLM analysis of its recent thumbnails.
+
+    With `incremental`, the profile's persisted state is used to fetch only
+    posts newer than the last run, and the previous analysis is reused when
+    the thumbnail set is mostly unchanged (see ANALYSIS_REUSE_OVERLAP).
+
+    Runs the stages in sequence; src.pipeline overlaps them across profiles.
+    """
+    with span("pricing.profile", page_url=page_url):
+        ctx = await fetch_profile(page_url, page_name, incremental=incremental)
+        if "result" in ctx:
+            return ctx["result"]
+        ctx = await build_collages(ctx, refresh_cache=refresh_cache)
+        ctx = await analyze_collages(ctx, analysis_mode=analysis_mode, group_size=group_size, refresh_cache=refresh_cache)
+        return await finish_pricing(ctx)
 
 if __name__ == "__main__":
     import asyncio
     import json
+    from src.clients import http_session_scope
     with open("./data/general_sample_profiles.json", "r") as f:
         general_sample_profiles = json.load(f)
     with open("./data/premium_sample_profiles.json", "r") as f:
         premium_sample_profiles = json.load(f)
     
-    for page in premium_sample_profiles[1:2]:
-        print(page["profile_link"], page["Username"])
-        pricing = asyncio.run(get_pricing_from_instagram(page["profile_link"], page["Username"]))
-        page["pricing"] = pricing
-        print(pricing)
-        print("-"*100)
+    async def price_pages(pages):
+        async with http_session_scope():
+            for page in pages:
+                print(page["profile_link"], page["Username"])
+                pricing = await get_pricing_from_instagram(page["profile_link"], page["Username"])
+                page["pricing"] = pricing
+                print(pricing)
+                print("-"*100)
+
+    asyncio.run(price_pages(premium_sample_profiles[1:2]))
     with open("./data/test.json", "w") as f:
         json.dump(premium_sample_profiles, f)
\ No newline at end of file
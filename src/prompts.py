@@ -54,6 +54,17 @@ NOTE: The resultant json should be a `*JSON parsable String*`
 {}
 """
 
+COMBINED_PROMPT_TEMPLATE = """Given the Account's Page give me each of the following sections in a single json object, If Screenshot has no Content put `None` values.
+NOTE: The resultant json should be a `*JSON parsable String*` with exactly these top-level keys: {keys}
+Each top-level key must hold the json object described in its section.
+{sections}
+"""
+
+COMBINED_SECTION_TEMPLATE = """
+### Section "{key}"
+{schema}
+"""
+
 
 LANGUAGE_SCHEMA = """{{
 "primary_language": <"Hindi", "Hinglish","English", "Tamil", "Telugu", "Bengali", "Marathi", "Punjabi", "Malayalam", "Kannada", "Gujarati", "Urdu", "Odia">,## Select One
@@ -125,4 +136,88 @@ PROFESSIONAL_ATTRIBUTES_SCHEMA = """{{
 BRAND_ELEMENTS_SCHEMA = """{{
 "brand_voice": ["Professional", "Casual", "Educational", "Entertaining", "Inspirational", "Authoritative", "Friendly", "Quirky", "Sarcastic", "Wholesome" ] select 2 - 3 in list,
 "personal_branding": <"Strong Personal Brand", "Business/Product Focus", "Community First", "Cause/Mission Driven", "Celebrity/Influencer", "Expert/Authority", "Lifestyle Brand", "Minimal Branding", "Meme Brand" select 1>
-}}"""
\ No newline at end of file
+}}"""
+
+## JSON schemas for structured outputs, one per prompt schema above.
+## Strict mode needs every property listed as required; `None` answers are null.
+
+def _one_of(*values):
+    return {"type": ["string", "null"], "enum": [*values, None]}
+
+def _many_of(*values):
+    return {"type": "array", "items": {"type": "string", "enum": list(values)}}
+
+def _text():
+    return {"type": ["string", "null"]}
+
+def _text_list():
+    return {"type": "array", "items": {"type": "string"}}
+
+def _object(**properties):
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+_LANGUAGES = ("Hindi", "Hinglish", "English", "Tamil", "Telugu", "Bengali", "Marathi", "Punjabi", "Malayalam", "Kannada", "Gujarati", "Urdu", "Odia")
+
+CATEGORIZE_JSON_SCHEMA = _object(
+    category=_one_of("premium", "general"),
+)
+
+LANGUAGE_JSON_SCHEMA = _object(
+    primary_language=_one_of(*_LANGUAGES),
+    secondary_languages=_many_of(*_LANGUAGES, "None"),
+)
+
+LOCATION_JSON_SCHEMA = _object(
+    geographic_focus=_one_of("Metro Only", "Regional Specific", "Pan-India"),
+    audience_location=_text_list(),
+)
+
+TARGET_DEMOGRAPHICS_JSON_SCHEMA = _object(
+    primary_target_audience_segment=_many_of(
+        "Gen Z", "Young Millennials", "Mature Millennials", "Gen X", "Baby Boomers",
+        "Professionals (e.g., B2B)", "Parents/Families", "Students", "Hobbyists", "General Public",
+    ),
+    inferred_age_skew_detailed=_one_of("Teens", "Young-Adults", "Mid-Career Adults", "Seniors", "All Ages"),
+    inferred_gender_skew=_one_of("Primarily Male", "Primarily Female", "Balanced"),
+)
+
+# Topics stay free-form: the prompt allows adding topics beyond the list
+CATEGORIZATION_TAGS_JSON_SCHEMA = _object(
+    topics=_text_list(),
+    category_primary=_text(),
+    category_secondary=_text_list(),
+    meme_format=_many_of("Image Macros", "Video Memes", "Screenshot Memes", "Multi-panel Comics", "Text-only", "Movie Reference"),
+    paragraph=_text(),
+)
+
+CONTENT_TAGS_JSON_SCHEMA = _object(
+    content_style=_many_of(
+        "Satirical", "Wholesome", "Edgy/Controversial", "Informative", "Inspirational", "Emotional",
+        "Nostalgic", "Dramatic", "Educational", "Aesthetic", "Traditional",
+    ),
+    content_quality=_one_of("Professional Studio", "High-End Creator", "Semi-Pro", "Amateur"),
+    brand_safety=_one_of("Completely Safe", "Generally Safe", "Edgy", "Controversial", "Adults Only"),
+)
+
+PROFESSIONAL_ATTRIBUTES_JSON_SCHEMA = _object(
+    technical_expertise=_one_of("Industry Expert", "Certified Professional", "Self-Taught Expert", "Enthusiast", "Beginner", "Not Applicable"),
+    production_value=_one_of("Professional Team", "Semi-Pro Setup", "High-End Solo Creator", "Smartphone Only"),
+    monetization=_one_of("Sponsored Only", "Multiple Streams", "Products/Merch", "Courses/Education", "Consulting/Services"),
+    brand_association=_one_of("Exclusive Deals", "Multiple Brands", "Selective Brands", "No Brands", "Own Brand Only"),
+)
+
+BRAND_ELEMENTS_JSON_SCHEMA = _object(
+    brand_voice=_many_of(
+        "Professional", "Casual", "Educational", "Entertaining", "Inspirational", "Authoritative",
+        "Friendly", "Quirky", "Sarcastic", "Wholesome",
+    ),
+    personal_branding=_one_of(
+        "Strong Personal Brand", "Business/Product Focus", "Community First", "Cause/Mission Driven",
+        "Celebrity/Influencer", "Expert/Authority", "Lifestyle Brand", "Minimal Branding", "Meme Brand",
+    ),
+)
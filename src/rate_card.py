@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.settings import load_env
+
+load_env()
+
+DEFAULT_RATE_CARD_PATH = os.path.join(os.path.dirname(__file__), "rate_card.json")
+RATE_CARD_PATH = os.getenv("RATE_CARD_PATH", DEFAULT_RATE_CARD_PATH)
+# Seconds between checks of the rate card file for changes
+RATE_CARD_CHECK_INTERVAL = float(os.getenv("RATE_CARD_CHECK_INTERVAL", "5"))
+
+
+def compile_pricing_tiers(tiers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Turn a list of rate card tiers
+    ({"followers": [min, max], "engagement": [min, max], "min_cost", "max_cost", "tier"},
+    with a null follower max meaning unbounded) into sorted follower/engagement
+    bin edges and 2D lookup tables indexed by [follower_bin, engagement_bin].
+    The tiers must form a full grid.
+    """
+    bins = []
+    for entry in tiers:
+        f_min, f_max = entry["followers"]
+        e_min, e_max = entry["engagement"]
+        f_max = float('inf') if f_max is None else f_max
+        bins.append((f_min, f_max, e_min, e_max, entry["min_cost"], entry["max_cost"], entry["tier"]))
+
+    follower_edges = sorted({f for (f_min, f_max, *_) in bins for f in (f_min, f_max)})
+    engagement_edges = sorted({e for (_, _, e_min, e_max, *_) in bins for e in (e_min, e_max)})
+    shape = (len(follower_edges) - 1, len(engagement_edges) - 1)
+    if len(bins) != shape[0] * shape[1]:
+        raise ValueError("Rate card tiers do not form a complete follower x engagement grid")
+
+    min_costs = np.zeros(shape, dtype=np.int64)
+    max_costs = np.zeros(shape, dtype=np.int64)
+    tier_names = np.empty(shape, dtype=object)
+    for f_min, f_max, e_min, e_max, internal_cost, pitching_cost, tier in bins:
+        i, j = follower_edges.index(f_min), engagement_edges.index(e_min)
+        if follower_edges[i + 1] != f_max or engagement_edges[j + 1] != e_max:
+            raise ValueError(f"Rate card bin {(f_min, f_max, e_min, e_max)} does not match the grid")
+        if tier_names[i, j] is not None:
+            raise ValueError(f"Rate card bin {(f_min, f_max, e_min, e_max)} is defined twice")
+        min_costs[i, j], max_costs[i, j], tier_names[i, j] = internal_cost, pitching_cost, tier
+
+    return {
+        "follower_edges": np.array(follower_edges, dtype=float),
+        "engagement_edges": np.array(engagement_edges, dtype=float),
+        "follower_ranges": np.array([
+            f"{f_min:,}-{f_max:,}" if f_max != float('inf') else f"{f_min:,}+"
+            for f_min, f_max in zip(follower_edges[:-1], follower_edges[1:])
+        ], dtype=object),
+        "engagement_ranges": np.array([
+            f"{e_min}-{e_max}%" for e_min, e_max in zip(engagement_edges[:-1], engagement_edges[1:])
+        ], dtype=object),
+        "min_costs": min_costs,
+        "max_costs": max_costs,
+        "tiers": tier_names,
+    }
+
+
+class RateCard:
+    """
+    A versioned rate card compiled into per-content-type lookup tables.
+    """
+
+    def __init__(self, version: str, content_types: Dict[str, List[Dict[str, Any]]], default_content_type: str, path: str = None, mtime: float = None):
+        if default_content_type not in content_types:
+            raise ValueError(f"Default content type {default_content_type} is not in the rate card")
+        self.version = version
+        self.default_content_type = default_content_type
+        self.path = path
+        self.mtime = mtime
+        self.pricing = {key.lower(): compile_pricing_tiers(tiers) for key, tiers in content_types.items()}
+
+    def resolve(self, content_type: str) -> Dict[str, Any]:
+        """Return the compiled tables for a content type, falling back to the default."""
+        return self.pricing.get((content_type or "").lower(), self.pricing[self.default_content_type])
+
+    @classmethod
+    def from_file(cls, path: str) -> "RateCard":
+        mtime = os.path.getmtime(path)
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(
+            version=str(data["version"]),
+            content_types=data["content_types"],
+            default_content_type=data.get("default_content_type", "general"),
+            path=path,
+            mtime=mtime,
+        )
+
+
+_rate_card: Optional[RateCard] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_rate_card() -> RateCard:
+    """
+    Return the current rate card, reloading it when the file has changed.
+
+    The file's mtime is checked at most every RATE_CARD_CHECK_INTERVAL
+    seconds. If a changed file fails to load, the previous card stays active.
+    """
+    global _rate_card, _checked_at
+    now = time.monotonic()
+    if _rate_card is not None and now - _checked_at < RATE_CARD_CHECK_INTERVAL:
+        return _rate_card
+    with _lock:
+        _checked_at = now
+        try:
+            mtime = os.path.getmtime(RATE_CARD_PATH)
+            if _rate_card is None or _rate_card.path != RATE_CARD_PATH or _rate_card.mtime != mtime:
+                _rate_card = RateCard.from_file(RATE_CARD_PATH)
+                logging.info(f"Loaded rate card {_rate_card.version} from {RATE_CARD_PATH}")
+        except Exception as e:
+            if _rate_card is None:
+                raise
+            logging.error(f"Failed to reload rate card from {RATE_CARD_PATH}, keeping {_rate_card.version}: {e}")
+    return _rate_card
+
+
+def set_rate_card_path(path: str):
+    """
+    Point pricing at a different rate card file; it is loaded on next use.
+    """
+    global RATE_CARD_PATH, _checked_at
+    RATE_CARD_PATH = path
+    _checked_at = 0.0
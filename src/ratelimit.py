@@ -0,0 +1,231 @@
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class CircuitOpenError(Exception):
+    """Raised when a circuit breaker is open and calls should fail fast."""
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at `rate` tokens per second up to `burst`.
+
+    `acquire` reserves tokens synchronously and then sleeps until they are
+    available, so concurrent callers on any event loop queue up fairly
+    without needing a loop-bound lock.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Take `tokens` from the bucket, possibly going into debt, and return
+        the number of seconds the caller must wait before proceeding.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens -= min(tokens, self.burst)
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+    async def acquire(self, tokens: float = 1) -> float:
+        """Wait until `tokens` are available. Returns the time spent waiting."""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def pause(self, seconds: float):
+        """Drain the bucket so that nobody proceeds for `seconds` (e.g. after a 429)."""
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    for `reset_timeout` seconds. After that a single trial call is let
+    through (half-open); success closes the circuit, failure reopens it.
+    A trial that reports neither within `trial_timeout` seconds (default
+    `reset_timeout`) frees its slot for the next caller.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, trial_timeout: float = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.trial_timeout = reset_timeout if trial_timeout is None else trial_timeout
+        self.failures = 0
+        self._opened_at = None
+        self._trial_started_at = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def _trial_in_flight(self) -> bool:
+        return (
+            self._trial_started_at is not None
+            and time.monotonic() - self._trial_started_at < self.trial_timeout
+        )
+
+    def check(self, name: str = "upstream") -> bool:
+        """
+        Raise CircuitOpenError unless a call may proceed. Returns True when
+        the call is the half-open trial; the caller must then record an
+        outcome or call release_trial() however the call ends.
+        """
+        state = self.state
+        if state == "open" or (state == "half-open" and self._trial_in_flight()):
+            raise CircuitOpenError(f"Circuit open for {name}, failing fast")
+        if state == "half-open":
+            self._trial_started_at = time.monotonic()
+            return True
+        return False
+
+    def release_trial(self):
+        """Free the trial slot without an outcome (e.g. the trial was cancelled)."""
+        self._trial_started_at = None
+
+    def record_success(self):
+        self.failures = 0
+        self._opened_at = None
+        self._trial_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_started_at = None
+        if self._opened_at is not None or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """
+    Exponential backoff with full jitter for the given (0-based) retry attempt.
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header given either as seconds or as an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestGovernor:
+    """
+    Keeps calls to a metered API under requests-per-minute and
+    tokens-per-minute budgets, retrying throttled and transient failures.
+
+    Each call reserves one request and its estimated token count; callers
+    queue until both budgets allow it. Exceptions of the `retry_on` types
+    are retried with backoff (honoring a retry-after hint from
+    `retry_after`), and throttling pauses the budgets for everyone.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        retry_on: Tuple[type, ...] = (),
+        throttle_on: Tuple[type, ...] = (),
+        retry_after: Callable[[Exception], Optional[float]] = lambda e: None,
+        max_attempts: int = 5,
+        backoff_cap: float = 60.0,
+    ):
+        self.requests = TokenBucket(rate=requests_per_minute / 60, burst=requests_per_minute)
+        self.tokens = TokenBucket(rate=tokens_per_minute / 60, burst=tokens_per_minute)
+        self.retry_on = retry_on
+        self.throttle_on = throttle_on
+        self.retry_after = retry_after
+        self.max_attempts = max_attempts
+        self.backoff_cap = backoff_cap
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def _wait_for_budget(self, tokens: float):
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        started = time.monotonic()
+        try:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(tokens)
+        finally:
+            self.queue_depth -= 1
+            waited = time.monotonic() - started
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    async def run(self, call: Callable[[], Awaitable[Any]], tokens: float) -> Any:
+        """
+        Run `call` once the budgets allow `tokens` more tokens, retrying on failure.
+        """
+        for attempt in range(self.max_attempts):
+            await self._wait_for_budget(tokens)
+            self.calls += 1
+            try:
+                return await call()
+            except self.retry_on as e:
+                if attempt + 1 >= self.max_attempts:
+                    raise
+                self.retries += 1
+                delay = self.retry_after(e)
+                if delay is None:
+                    delay = backoff_delay(attempt, cap=self.backoff_cap)
+                delay = min(delay, self.backoff_cap)
+                logging.warning(f"Retrying after {type(e).__name__} in {delay:.2f}s (attempt {attempt + 1})")
+                if isinstance(e, self.throttle_on):
+                    self.throttled += 1
+                    self.requests.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+
+    def settle(self, estimated_tokens: float, actual_tokens: float):
+        """
+        Correct the token budget once the real usage of a call is known.
+        """
+        self.tokens.reserve(actual_tokens - estimated_tokens)
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "total_wait_seconds": round(self.total_wait, 3),
+            "max_wait_seconds": round(self.max_wait, 3),
+            "avg_wait_seconds": round(self.total_wait / self.calls, 3) if self.calls else 0.0,
+        }
@@ -0,0 +1,211 @@
+"""
+Headless HTTP API for pricing, for integrations that don't need the UI.
+
+    python -m src.server --port 8080
+
+    GET  /health
+    GET  /pricing?url=<profile url>[&name=<page name>][&max_age=<seconds>][&refresh=true]
+    POST /pricing/batch   {"profiles": [...], "concurrency": 10}  -> NDJSON, one line per profile
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+from src.cache import SQLiteCache, make_cache_key
+from src.clients import http_session_scope, openai_governor
+from src.batch import iter_pricing, normalize_profile, profile_key
+from src.pricing import get_pricing_from_instagram
+from src.settings import load_env
+
+load_env()
+
+# How long a computed price is served before the pipeline runs again
+PRICING_RESULT_TTL = float(os.getenv("PRICING_RESULT_TTL", str(6 * 3600)))
+PRICING_RESULT_CACHE_PATH = os.getenv("PRICING_RESULT_CACHE_PATH", ".cache/pricing_results.sqlite")
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "20"))
+
+
+class PricingService:
+    """
+    Prices profiles with request coalescing and a result cache.
+
+    Concurrent requests for the same profile share one pipeline run. Successful
+    results are cached for `ttl` seconds and returned with freshness metadata.
+    """
+
+    def __init__(self, cache: Optional[SQLiteCache], ttl: float = PRICING_RESULT_TTL, **pricer_kwargs):
+        self.cache = cache
+        self.ttl = ttl
+        self.pricer_kwargs = pricer_kwargs
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.runs = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    async def _run(self, key: str, page_url: str, page_name: str) -> Dict[str, Any]:
+        self.runs += 1
+        pricing = await get_pricing_from_instagram(page_url, page_name, **self.pricer_kwargs)
+        entry = {"pricing": pricing, "priced_at": time.time()}
+        if self.cache is not None and "error" not in pricing:
+            await asyncio.to_thread(self.cache.set, key, entry)
+        return entry
+
+    async def price(self, page_url: str, page_name: str = None, max_age: float = None, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Return {"pricing", "freshness"}. A cached result is served when it is
+        younger than `max_age` (default: the cache TTL) unless `refresh` is set.
+        """
+        page_url, page_name = normalize_profile((page_url, page_name))
+        key = make_cache_key("pricing", profile_key(page_url))
+        max_age = self.ttl if max_age is None else min(max_age, self.ttl)
+
+        if self.cache is not None and not refresh:
+            entry = await asyncio.to_thread(self.cache.get, key, max_age)
+            if entry is not None:
+                self.cache_hits += 1
+                return self._respond(entry, cached=True, coalesced=False)
+
+        task = self._in_flight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(self._run(key, page_url, page_name))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shield the shared run so one client disconnecting doesn't cancel it for the rest
+        entry = await asyncio.shield(task)
+        return self._respond(entry, cached=False, coalesced=coalesced)
+
+    def _respond(self, entry: Dict[str, Any], cached: bool, coalesced: bool) -> Dict[str, Any]:
+        age = time.time() - entry["priced_at"]
+        return {
+            "pricing": entry["pricing"],
+            "freshness": {
+                "cached": cached,
+                "coalesced": coalesced,
+                "priced_at": round(entry["priced_at"], 3),
+                "age_seconds": round(age, 3),
+                "expires_in_seconds": round(max(0.0, self.ttl - age), 3),
+            },
+        }
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "runs": self.runs,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "in_flight": len(self._in_flight),
+        }
+
+
+def dumps(data: Any) -> str:
+    return json.dumps(data, default=str)
+
+
+def parse_bool(value: Optional[str]) -> bool:
+    return (value or "").lower() in ("1", "true", "yes")
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    service: PricingService = request.app["service"]
+    return web.json_response({"status": "ok", "service": service.metrics(), "openai": openai_governor.metrics()})
+
+
+async def handle_pricing(request: web.Request) -> web.Response:
+    service: PricingService = request.app["service"]
+    page_url = request.query.get("url")
+    if not page_url:
+        raise web.HTTPBadRequest(text=dumps({"error": "Missing url parameter"}), content_type="application/json")
+    try:
+        max_age = float(request.query["max_age"]) if "max_age" in request.query else None
+    except ValueError:
+        raise web.HTTPBadRequest(text=dumps({"error": "max_age must be a number"}), content_type="application/json")
+
+    try:
+        result = await service.price(
+            page_url, request.query.get("name"), max_age=max_age, refresh=parse_bool(request.query.get("refresh"))
+        )
+    except Exception as e:
+        logging.error(f"Pricing failed for {page_url}: {e}")
+        return web.json_response({"page_url": page_url, "error": str(e)}, status=502, dumps=dumps)
+    status = 422 if "error" in result["pricing"] else 200
+    return web.json_response({"page_url": page_url} | result, status=status, dumps=dumps)
+
+
+async def handle_batch(request: web.Request) -> web.StreamResponse:
+    """
+    Price a list of profiles and stream one JSON line per profile as each completes.
+    """
+    service: PricingService = request.app["service"]
+    try:
+        body = await request.json()
+        profiles = body["profiles"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        profiles = None
+    if not isinstance(profiles, list):
+        raise web.HTTPBadRequest(text=dumps({"error": 'Expected a JSON body with a "profiles" list'}), content_type="application/json")
+    try:
+        concurrency = max(1, min(int(body.get("concurrency", 10)), BATCH_MAX_CONCURRENCY))
+    except (ValueError, TypeError):
+        raise web.HTTPBadRequest(text=dumps({"error": "concurrency must be an integer"}), content_type="application/json")
+    try:
+        max_age = float(body["max_age"]) if body.get("max_age") is not None else None
+    except (ValueError, TypeError):
+        raise web.HTTPBadRequest(text=dumps({"error": "max_age must be a number"}), content_type="application/json")
+    refresh = body.get("refresh", False)
+    refresh = parse_bool(refresh) if isinstance(refresh, str) else bool(refresh)
+
+    async def price(page_url: str, page_name: str) -> Dict[str, Any]:
+        return await service.price(page_url, page_name, max_age=max_age, refresh=refresh)
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    async for record in iter_pricing(profiles, concurrency=concurrency, pricer=price):
+        # Flatten {"pricing": {"pricing", "freshness"}} from the service into the record
+        record.update(record.pop("pricing", {}))
+        await response.write((dumps(record) + "\n").encode("utf-8"))
+    await response.write_eof()
+    return response
+
+
+async def http_session_context(app: web.Application):
+    async with http_session_scope():
+        yield
+
+
+def create_app(service: PricingService = None) -> web.Application:
+    if service is None:
+        cache = SQLiteCache(PRICING_RESULT_CACHE_PATH, ttl=PRICING_RESULT_TTL) if PRICING_RESULT_CACHE_PATH else None
+        service = PricingService(cache)
+    app = web.Application()
+    app["service"] = service
+    app.cleanup_ctx.append(http_session_context)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/pricing", handle_pricing)
+    app.router.add_post("/pricing/batch", handle_batch)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the pricing pipeline over HTTP")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--analysis-mode", choices=["separate", "combined"], default="separate")
+    parser.add_argument("--group-size", type=int, help="schemas per request in combined mode")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    cache = SQLiteCache(PRICING_RESULT_CACHE_PATH, ttl=PRICING_RESULT_TTL) if PRICING_RESULT_CACHE_PATH else None
+    service = PricingService(cache, analysis_mode=args.analysis_mode, group_size=args.group_size)
+    web.run_app(create_app(service), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,26 @@
 import logging
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from datetime import datetime
 import os
 
-from dotenv import load_dotenv
 from src.clients import call_rapid_api
+from src.settings import get_settings
+from src.tracing import span
+from src.settings import load_env
 
-load_dotenv(override=True)
+load_env()
 
-api_key = os.getenv("RAPID_API_KEY")
+# Profile data changes slowly, media chunks (counts) more often
+PROFILE_CACHE_TTL = float(os.getenv("RAPID_API_PROFILE_CACHE_TTL", str(6 * 3600)))
+MEDIA_CACHE_TTL = float(os.getenv("RAPID_API_MEDIA_CACHE_TTL", "3600"))
+
+
+def rapid_api_endpoint(path: str) -> Tuple[str, Dict[str, str]]:
+    """URL and auth headers for a RapidAPI path; set RAPID_API_BASE_URL to use a local stand-in."""
+    settings = get_settings()
+    headers = {"x-rapidapi-key": settings.rapid_api_key, "x-rapidapi-host": settings.rapid_api_host}
+    return f"{settings.rapid_api_base_url}{path}", headers
 
 
 def extract_instagram_post_data(posts_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -125,42 +136,133 @@ def extract_instagram_post_data(posts_data: List[Dict[str, Any]]) -> List[Dict[s
     return extracted_posts
 
 
+def extract_instagram_post_summary(posts_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Slim projection of RapidAPI post dicts for pricing: code, timestamp, type,
+    engagement counts and the first thumbnail URL. Skips captions, hashtags
+    and the full media/version lists.
+    """
+    summaries = []
+    for post in posts_data:
+        if not isinstance(post, dict):
+            continue
+        post_type = {1: "image", 2: "video", 8: "carousel"}.get(post.get("media_type"), post.get("product_type", "unknown"))
+        taken_at_iso = post.get("taken_at")
+
+        thumbnail_url = None
+        resources = post.get("resources", []) if post_type == "carousel" else [post]
+        for item in resources:
+            image_versions = item.get("image_versions") or []
+            if item.get("media_type") in (1, 2) and image_versions and image_versions[0].get("url"):
+                thumbnail_url = image_versions[0]["url"]
+                break
+
+        summaries.append({
+            "code": post.get("code"),
+            "taken_at": int(datetime.fromisoformat(taken_at_iso.replace('Z', '+00:00')).timestamp()) if taken_at_iso else None,
+            "type": post_type,
+            "like_count": post.get("like_count", 0),
+            "comment_count": post.get("comment_count", 0),
+            "share_count": post.get("share_count", 0),
+            "played_count": (post.get("play_count") or post.get("view_count", 0)) if post_type == "video" else 0,
+            "thumbnail_url": thumbnail_url,
+        })
+    return summaries
+
+
+def extract_thumbnail_urls(posts: List[Dict[str, Any]]) -> List[str]:
+    """
+    Return the first image/thumbnail URL of each post, for full or slim post dicts.
+    """
+    image_urls = []
+    for post in posts:
+        if post.get("thumbnail_url"):
+            image_urls.append(post["thumbnail_url"])
+            continue
+        for media in post.get("media_list") or []:
+            if media.get('type') in ['thumbnail', 'image'] and media.get('url'):
+                image_urls.append(media.get('url'))
+                break
+    return image_urls
+
+
 async def get_instagram_post_info(
-    page_id: str, n_posts: int = 500
+    page_id: str,
+    n_posts: int = 500,
+    exact: bool = False,
+    keep_raw: bool = True,
+    slim: bool = False,
+    since: int = None,
 ) -> tuple:
+    """
+    Fetch the latest posts of a profile through chunk pagination.
+
+    Args:
+        page_id: Instagram user id (pk)
+        n_posts: Number of posts wanted
+        exact: Stop at exactly `n_posts` instead of keeping the whole last chunk
+        keep_raw: Keep the raw RapidAPI post dicts; when False the second
+                  return value is an empty list
+        slim: Return `extract_instagram_post_summary` projections instead of
+              full `extract_instagram_post_data` dicts
+        since: Only return posts taken after this Unix timestamp and stop
+               paginating once a chunk reaches it (incremental re-pricing)
 
+    Returns:
+        (post_array, raw_post_array)
+    """
+    extract = extract_instagram_post_summary if slim else extract_instagram_post_data
     pagination_token = None
     post_array = []
     raw_post_array = []
     should_continue = True
+    pages = 0
 
     query_string = {"user_id": page_id}
-    url = "https://instagram-premium-api-2023.p.rapidapi.com/v1/user/medias/chunk"
-    headers = {"x-rapidapi-key": api_key, "x-rapidapi-host": "instagram-premium-api-2023.p.rapidapi.com"}
+    url, headers = rapid_api_endpoint("/v1/user/medias/chunk")
 
     while should_continue:
         if pagination_token:
             query_string["end_cursor"] = pagination_token
 
-        data = await call_rapid_api(url=url, params=query_string, headers=headers)
+        with span("rapidapi.media_chunk", page=pages, user_id=page_id) as chunk:
+            data = await call_rapid_api(url=url, params=query_string, headers=headers, cache_ttl=MEDIA_CACHE_TTL)
+            chunk.set(posts=len(data[0]) if data else 0)
+        pages += 1
         if not data:
             return [], []
 
         posts = data[0]
         pagination_token = data[1]
 
+        reached_since = False
+        if posts and since is not None:
+            posts_info = extract_instagram_post_summary(posts)
+            # Chunks are newest first (after pinned posts), so the last post is the oldest
+            reached_since = posts_info[-1]["taken_at"] is not None and posts_info[-1]["taken_at"] <= since
+            posts = [
+                post for post, info in zip(posts, posts_info)
+                if info["taken_at"] is None or info["taken_at"] > since
+            ]
+
+        if posts and exact:
+            posts = posts[:n_posts - len(post_array)]
         if posts:
-            posts_info = extract_instagram_post_data(posts)
+            posts_info = extract(posts)
             post_array.extend(posts_info)
-            raw_post_array.extend(posts)
+            if keep_raw:
+                raw_post_array.extend(posts)
 
         # Stop conditions:
         # 1. If we have enough posts (n_posts limit reached)
         # 2. If no more pagination token available
+        # 3. If the chunk reached posts already seen (`since`)
         if len(post_array) >= n_posts:
             should_continue = False
         elif not pagination_token:
             should_continue = False
+        elif reached_since:
+            should_continue = False
 
     return post_array, raw_post_array
 
@@ -196,10 +298,10 @@ def extract_instagram_page_info(page_data: dict) -> dict:
 async def get_instagram_page_info(page_url: str) -> dict:
     try:
         query_string = {"url": page_url}
-        url = "https://instagram-premium-api-2023.p.rapidapi.com/v1/user/by/url"
-        headers = {"x-rapidapi-key": api_key, "x-rapidapi-host": "instagram-premium-api-2023.p.rapidapi.com"}
+        url, headers = rapid_api_endpoint("/v1/user/by/url")
 
-        data = await call_rapid_api(url, params=query_string, headers=headers)
+        with span("rapidapi.page_info", page_url=page_url):
+            data = await call_rapid_api(url, params=query_string, headers=headers, cache_ttl=PROFILE_CACHE_TTL)
         if data.get("exc_type"):
             raise Exception(f"{data.get('exc_type')}")
         if data:
@@ -212,6 +314,12 @@ async def get_instagram_page_info(page_url: str) -> dict:
 
 if __name__ == "__main__":
     import asyncio
-    post_array, raw_post_array = asyncio.run(get_instagram_post_info(page_url="https://www.instagram.com/pubity", n_posts=10))
+    from src.clients import http_session_scope
+
+    async def fetch_posts():
+        async with http_session_scope():
+            return await get_instagram_post_info(page_url="https://www.instagram.com/pubity", n_posts=10)
+
+    post_array, raw_post_array = asyncio.run(fetch_posts())
     print(post_array)
     print(raw_post_array)
\ No newline at end of file
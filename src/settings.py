@@ -0,0 +1,45 @@
+import os
+import functools
+from dataclasses import dataclass
+from typing import Optional
+
+_env_loaded = False
+
+
+def load_env():
+    """
+    Load .env into the environment, once per process. Every module that reads
+    its tuning knobs at import time calls this first, so .env applies however
+    the code is entered; get_settings() calls it before reading credentials.
+    """
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv(override=True)
+        _env_loaded = True
+
+
+@dataclass(frozen=True)
+class Settings:
+    openai_api_key: Optional[str]
+    rapid_api_key: Optional[str]
+    rapid_api_host: str
+    rapid_api_base_url: str
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        rapid_api_host = os.getenv("RAPID_API_HOST", "instagram-premium-api-2023.p.rapidapi.com")
+        return cls(
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            rapid_api_key=os.getenv("RAPID_API_KEY"),
+            rapid_api_host=rapid_api_host,
+            # Point at another host (e.g. the fakes in src.benchmarks) without changing the Host header
+            rapid_api_base_url=os.getenv("RAPID_API_BASE_URL", f"https://{rapid_api_host}"),
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Credentials and endpoints, read on first use rather than at import."""
+    load_env()
+    return Settings.from_env()
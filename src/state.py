@@ -0,0 +1,61 @@
+import os
+import time
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from src.cache import SQLiteCache
+from src.settings import load_env
+
+load_env()
+
+# Persisted per-profile state for incremental re-pricing, keyed by Instagram pk
+profile_state_store = SQLiteCache(path=os.getenv("PROFILE_STATE_PATH", ".cache/profile_state.sqlite"))
+
+# Reuse the previous LLM analysis when at least this share of thumbnails is unchanged
+ANALYSIS_REUSE_OVERLAP = float(os.getenv("ANALYSIS_REUSE_OVERLAP", "0.8"))
+
+
+async def load_profile_state(profile_id: str) -> Optional[Dict[str, Any]]:
+    return await asyncio.to_thread(profile_state_store.get, str(profile_id))
+
+
+async def save_profile_state(
+    profile_id: str,
+    posts: List[Dict[str, Any]],
+    thumbnail_keys: List[str],
+    analysis: Optional[Dict[str, Any]],
+):
+    """
+    Persist the posts (slim projections with their metrics), the media keys
+    of the analyzed thumbnails and the last successful analysis.
+    """
+    taken_at = [post["taken_at"] for post in posts if post.get("taken_at") is not None]
+    state = {
+        "posts": posts,
+        "last_taken_at": max(taken_at) if taken_at else None,
+        "last_code": posts[0].get("code") if posts else None,
+        "thumbnail_keys": thumbnail_keys,
+        "analysis": analysis,
+        "updated_at": int(time.time()),
+    }
+    await asyncio.to_thread(profile_state_store.set, str(profile_id), state)
+
+
+def merge_posts(new_posts: List[Dict[str, Any]], cached_posts: List[Dict[str, Any]], n_posts: int) -> List[Dict[str, Any]]:
+    """
+    Put newly fetched posts ahead of cached ones (dropping duplicates by code)
+    and keep the latest `n_posts`.
+    """
+    new_codes = {post.get("code") for post in new_posts}
+    merged = new_posts + [post for post in cached_posts if post.get("code") not in new_codes]
+    return merged[:n_posts]
+
+
+def thumbnail_overlap(previous_keys: List[str], current_keys: List[str]) -> float:
+    """
+    Share of the current thumbnails that were already analyzed last time.
+    """
+    if not current_keys:
+        return 0.0
+    previous = set(previous_keys or [])
+    return sum(key in previous for key in current_keys) / len(current_keys)
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.settings import load_env
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+load_env()
+
+# Append finished spans as JSON lines to this file; unset to disable
+TRACE_FILE = os.getenv("TRACE_FILE")
+# Mirror spans to the configured OpenTelemetry tracer provider (needs opentelemetry-api)
+TRACE_OTEL = os.getenv("TRACE_OTEL", "false").lower() in ("1", "true", "yes")
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    duration: float = 0.0
+    status: str = "ok"
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key: str, value: float = 1):
+        """Increment a numeric attribute, e.g. retries or bytes."""
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+_collector: contextvars.ContextVar[Optional[List[Span]]] = contextvars.ContextVar("span_collector", default=None)
+_current_otel_span = contextvars.ContextVar("current_otel_span", default=None)
+_trace_file = None
+_trace_file_lock = threading.Lock()
+
+
+def _export(finished: Span):
+    global _trace_file
+    collector = _collector.get()
+    if collector is not None:
+        collector.append(finished)
+    if TRACE_FILE:
+        line = json.dumps(asdict(finished), default=str) + "\n"
+        with _trace_file_lock:
+            try:
+                if _trace_file is None:
+                    os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+                    _trace_file = open(TRACE_FILE, "a", buffering=1)
+                _trace_file.write(line)
+            except OSError as e:
+                logging.warning(f"Could not write span to {TRACE_FILE}: {e}")
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """
+    Time a block of work as a span nested under the current one. Works across
+    await points and tasks started inside the block. Exceptions mark the span
+    as failed and propagate.
+    """
+    parent = _current_span.get()
+    current = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+        span_id=uuid.uuid4().hex[:16],
+        parent_id=parent.span_id if parent else None,
+        start=time.time(),
+        attributes=attributes,
+    )
+    token = _current_span.set(current)
+    otel_span, otel_token = None, None
+    if TRACE_OTEL and otel_trace is not None:
+        otel_parent = _current_otel_span.get()
+        context = otel_trace.set_span_in_context(otel_parent) if otel_parent is not None else None
+        otel_span = otel_trace.get_tracer("wldd-pricing").start_span(name, context=context)
+        otel_token = _current_otel_span.set(otel_span)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        _current_span.reset(token)
+        if otel_span is not None:
+            _current_otel_span.reset(otel_token)
+            for key, value in current.attributes.items():
+                if isinstance(value, (str, bool, int, float)):
+                    otel_span.set_attribute(key, value)
+            if current.error:
+                otel_span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, current.error))
+            otel_span.end()
+        _export(current)
+
+
+def traced(name: str):
+    """Decorator that runs an async function inside a span called `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attributes(**attributes):
+    """Set attributes on the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+@contextmanager
+def collect_spans() -> Iterator[List[Span]]:
+    """Collect every span finished inside the block (and its tasks) into a list."""
+    spans: List[Span] = []
+    token = _collector.set(spans)
+    try:
+        yield spans
+    finally:
+        _collector.reset(token)
+
+
+def summarize_spans(spans: List[Span]) -> List[Dict[str, Any]]:
+    """
+    One row per span name: count, total/mean/max seconds, errors, and the
+    sums of the bytes, tokens, retries and cache-hit attributes.
+    """
+    rows: Dict[str, Dict[str, Any]] = {}
+    for item in spans:
+        row = rows.setdefault(item.name, {
+            "span": item.name, "count": 0, "total_seconds": 0.0, "max_seconds": 0.0, "errors": 0,
+            "bytes": 0, "tokens": 0, "retries": 0, "cache_hits": 0,
+        })
+        row["count"] += 1
+        row["total_seconds"] += item.duration
+        row["max_seconds"] = max(row["max_seconds"], item.duration)
+        row["errors"] += item.status == "error"
+        row["bytes"] += item.attributes.get("bytes", 0) or 0
+        row["tokens"] += item.attributes.get("total_tokens", 0) or 0
+        row["retries"] += item.attributes.get("retries", 0) or 0
+        row["cache_hits"] += bool(item.attributes.get("cache_hit"))
+    for row in rows.values():
+        row["mean_seconds"] = round(row["total_seconds"] / row["count"], 4)
+        row["total_seconds"] = round(row["total_seconds"], 4)
+        row["max_seconds"] = round(row["max_seconds"], 4)
+    return sorted(rows.values(), key=lambda row: row["total_seconds"], reverse=True)
@@ -0,0 +1,139 @@
+import os
+import json
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from src.settings import load_env
+
+load_env()
+
+# USD per 1M tokens; override or extend with a JSON file of the same shape (OPENAI_PRICE_TABLE_PATH)
+DEFAULT_MODEL_PRICES = {
+    "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt-4.1-nano": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+}
+OPENAI_PRICE_TABLE_PATH = os.getenv("OPENAI_PRICE_TABLE_PATH")
+
+
+def load_model_prices(path: Optional[str] = OPENAI_PRICE_TABLE_PATH) -> Dict[str, Dict[str, float]]:
+    prices = dict(DEFAULT_MODEL_PRICES)
+    if path:
+        with open(path, "r") as f:
+            prices.update(json.load(f))
+    return prices
+
+
+MODEL_PRICES = load_model_prices()
+
+
+def usage_cost(model: str, input_tokens: int, cached_tokens: int, output_tokens: int) -> Optional[float]:
+    """
+    USD cost of one call. Cached input tokens are billed at the cached rate.
+    Returns None for models missing from the price table.
+    """
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        # Dated snapshots (e.g. gpt-4.1-mini-2025-04-14) bill like their base model
+        prices = next((p for name, p in MODEL_PRICES.items() if model.startswith(f"{name}-")), None)
+    if prices is None:
+        return None
+    uncached = input_tokens - cached_tokens
+    return (
+        uncached * prices["input"]
+        + cached_tokens * prices.get("cached_input", prices["input"])
+        + output_tokens * prices["output"]
+    ) / 1_000_000
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {"calls": 0, "cache_hits": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+
+
+class UsageTracker:
+    """
+    Aggregates LLM usage and cost in total, per schema and per model.
+    """
+
+    def __init__(self):
+        self.total = _empty_totals()
+        self.by_schema: Dict[str, Dict[str, Any]] = {}
+        self.by_model: Dict[str, Dict[str, Any]] = {}
+        self.unpriced_models = set()
+
+    def _rows(self, schema: str, model: str):
+        yield self.total
+        yield self.by_schema.setdefault(schema, _empty_totals())
+        if model is not None:
+            yield self.by_model.setdefault(model, _empty_totals())
+
+    def record(self, model: str, schema: str, input_tokens: int, cached_tokens: int, output_tokens: int):
+        cost = usage_cost(model, input_tokens, cached_tokens, output_tokens)
+        if cost is None:
+            self.unpriced_models.add(model)
+        for row in self._rows(schema, model):
+            row["calls"] += 1
+            row["input_tokens"] += input_tokens
+            row["cached_tokens"] += cached_tokens
+            row["output_tokens"] += output_tokens
+            row["cost_usd"] += cost or 0.0
+
+    def record_cache_hit(self, schema: str):
+        """A result served from the LLM cache: no tokens, no cost."""
+        for row in self._rows(schema, None):
+            row["cache_hits"] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        def rounded(row):
+            return row | {"cost_usd": round(row["cost_usd"], 6)}
+
+        summary = {
+            "total": rounded(self.total),
+            "by_schema": {schema: rounded(row) for schema, row in self.by_schema.items()},
+            "by_model": {model: rounded(row) for model, row in self.by_model.items()},
+        }
+        if self.unpriced_models:
+            summary["unpriced_models"] = sorted(self.unpriced_models)
+        return summary
+
+
+_trackers: contextvars.ContextVar[Tuple[UsageTracker, ...]] = contextvars.ContextVar("usage_trackers", default=())
+_warned_models = set()
+
+
+@contextmanager
+def track_usage() -> Iterator[UsageTracker]:
+    """
+    Record every LLM call made inside the block (and tasks it starts) into a
+    new tracker. Trackers nest, so a profile's usage also counts toward the
+    batch it runs in.
+    """
+    tracker = UsageTracker()
+    token = _trackers.set(_trackers.get() + (tracker,))
+    try:
+        yield tracker
+    finally:
+        _trackers.reset(token)
+
+
+def record_usage(model: str, schema: str, usage: Any):
+    """Record a Responses API `usage` object into every active tracker."""
+    trackers = _trackers.get()
+    if not trackers or usage is None:
+        return
+    details = getattr(usage, "input_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    for tracker in trackers:
+        tracker.record(model, schema, usage.input_tokens, cached_tokens, usage.output_tokens)
+    if model in trackers[0].unpriced_models and model not in _warned_models:
+        _warned_models.add(model)
+        logging.warning(f"No price for model {model}; its cost is counted as 0 (see OPENAI_PRICE_TABLE_PATH)")
+
+
+def record_cache_hit(schema: str):
+    for tracker in _trackers.get():
+        tracker.record_cache_hit(schema)
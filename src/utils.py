@@ -1,72 +1,291 @@
+import os
 import re
+import math
 import logging
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from PIL import Image
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 import asyncio
 
-from src.clients import download_image
+import numpy as np
+
+from src.clients import download_image_bytes, media_cache_key
+from src.cache import TTLCache, SQLiteCache, TieredCache
+from src.tracing import span
+from src.settings import load_env
+
+load_env()
+
+# Where CPU-bound collage work runs: "process", "thread" or "inline" (on the event loop)
+COLLAGE_EXECUTOR = os.getenv("COLLAGE_EXECUTOR", "process")
+COLLAGE_WORKERS = int(os.getenv("COLLAGE_WORKERS", "0")) or None
+
+_collage_executor = None
+
+def image_nbytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+# Decoded thumbnails, already shrunk to the collage cell, keyed by media identity and cell size
+thumbnail_cache = TTLCache(
+    max_entries=int(os.getenv("THUMBNAIL_CACHE_MAX_ENTRIES", "2048")),
+    max_bytes=int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES", str(128 * 1024 * 1024))),
+    sizeof=image_nbytes,
+)
+
+# Drop near-duplicate thumbnails (reposts, templated memes) before building collages
+THUMBNAIL_DEDUP = os.getenv("THUMBNAIL_DEDUP", "true").lower() in ("1", "true", "yes")
+# dHash bits (out of 64) two thumbnails may differ by and still count as duplicates
+THUMBNAIL_HASH_DISTANCE = int(os.getenv("THUMBNAIL_HASH_DISTANCE", "6"))
+# Extra posts fetched beyond the collage images, to backfill dropped duplicates
+THUMBNAIL_BACKFILL_POSTS = int(os.getenv("THUMBNAIL_BACKFILL_POSTS", "9"))
+THUMBNAIL_HASH_CACHE_PATH = os.getenv("THUMBNAIL_HASH_CACHE_PATH", ".cache/thumbnail_hashes.sqlite")
+
+# Perceptual hashes keyed by media identity; set THUMBNAIL_HASH_CACHE_PATH="" to keep them in memory only
+thumbnail_hash_cache = TieredCache(
+    TTLCache(max_entries=int(os.getenv("THUMBNAIL_CACHE_MAX_ENTRIES", "2048"))),
+    SQLiteCache(
+        THUMBNAIL_HASH_CACHE_PATH,
+        ttl=float(os.getenv("THUMBNAIL_HASH_CACHE_TTL", str(30 * 24 * 3600))),
+        max_entries=int(os.getenv("THUMBNAIL_HASH_CACHE_MAX_ENTRIES", "200000")),
+    ) if THUMBNAIL_HASH_CACHE_PATH else None,
+)
 
 def extract_x(response: str, code_type: str) -> str:
     pattern = rf"```{code_type}\s*(.*?)```"
     match = re.search(pattern, response, re.DOTALL)
     return match.group(1).strip() if match else response
 
-async def create_collage_from_urls(image_urls:List[str], width:int=800, height:int=1000, layout:Tuple=None)-> Image:
+def get_collage_executor() -> Optional[Executor]:
     """
-    Creates a collage from a list of image URLs.
-    
-    Parameters:
-    - image_urls: List of URLs to the images
-    - output_path: Path where the collage will be saved
-    - width: Width of the output collage
-    - height: Height of the output collage
-    - layout: Tuple indicating (rows, columns). If None, it will be calculated automatically.
+    Return the shared executor for collage decoding and compositing,
+    or None when COLLAGE_EXECUTOR is "inline".
+    """
+    global _collage_executor
+    if _collage_executor is None and COLLAGE_EXECUTOR != "inline":
+        if COLLAGE_EXECUTOR == "process":
+            # spawn avoids forking the threads of a running Streamlit server
+            _collage_executor = ProcessPoolExecutor(
+                max_workers=COLLAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        elif COLLAGE_EXECUTOR == "thread":
+            _collage_executor = ThreadPoolExecutor(max_workers=COLLAGE_WORKERS, thread_name_prefix="collage")
+        else:
+            raise ValueError(f"Unknown COLLAGE_EXECUTOR: {COLLAGE_EXECUTOR}. Expected 'process', 'thread' or 'inline'")
+    return _collage_executor
+
+def configure_collage_executor(kind: str, workers: int = None):
+    """
+    Switch the collage executor ("process", "thread" or "inline") and worker count.
+    """
+    global COLLAGE_EXECUTOR, COLLAGE_WORKERS
+    shutdown_collage_executor()
+    COLLAGE_EXECUTOR = kind
+    COLLAGE_WORKERS = workers
+
+def shutdown_collage_executor(wait: bool = False):
+    global _collage_executor
+    if _collage_executor is not None:
+        _collage_executor.shutdown(wait=wait, cancel_futures=True)
+        _collage_executor = None
+
+async def run_in_collage_executor(func, *args):
+    """
+    Run a CPU-bound function in the collage executor without blocking the loop.
+    """
+    executor = get_collage_executor()
+    if executor is None:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+def collage_layout(n: int) -> Tuple[int, int]:
+    """
+    Return (rows, columns) for a collage of n images.
+    """
+    if n <= 2:
+        return 1, n
+    elif n <= 4:
+        return 2, 2
+    elif n <= 6:
+        return 2, 3
+    elif n <= 9:
+        return 3, 3
+    # Calculate approximately square layout
+    cols = math.ceil(math.sqrt(n))
+    rows = math.ceil(n / cols)
+    return rows, cols
+
+def open_thumbnail(content: bytes, size: Tuple[int, int]) -> Optional[Image.Image]:
+    """
+    Decode image bytes and shrink them to fit `size`, keeping the aspect
+    ratio. JPEGs use draft mode (DCT scaling while decoding); other formats
+    are reduced by an integer factor before the final resize. Returns None
+    if undecodable.
+    """
+    try:
+        img = Image.open(BytesIO(content))
+        if img.format == "JPEG":
+            img.draft("RGB", size)
+        img.load()
+        factor = min(img.width // size[0], img.height // size[1])
+        if factor >= 2:
+            img = to_reducible_mode(img).reduce(factor)
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+    except Exception as e:
+        logging.warning(f"Could not decode image: {e}")
+        return None
+    return img
+
+def to_reducible_mode(img: Image.Image) -> Image.Image:
+    """
+    Convert palette, 1-bit and 16-bit grayscale images, which Image.reduce
+    rejects, to RGB(A) or 8-bit grayscale. Other modes are returned as is.
+    """
+    if img.mode == "P":
+        return img.convert("RGBA" if "transparency" in img.info else "RGB")
+    if img.mode == "1":
+        return img.convert("L")
+    if img.mode.startswith("I;16"):
+        # convert("L") clips 16-bit values at 255; keep the high byte instead
+        return Image.fromarray((np.asarray(img) >> 8).astype(np.uint8))
+    return img
+
+async def get_thumbnail(url: str, size: Tuple[int, int], content: bytes = None) -> Optional[Image.Image]:
+    """
+    Return the image at `url` decoded at a resolution covering `size`.
+    Served from the in-memory thumbnail cache when the same media was
+    decoded before; otherwise decoded in the collage executor from
+    `content`, or from a fresh download (through the byte cache).
+    """
+    key = (media_cache_key(url), size)
+    thumbnail = thumbnail_cache.get(key)
+    if thumbnail is not None:
+        return thumbnail
+    if content is None:
+        content = await download_image_bytes(url)
+    if content is None:
+        return None
+    thumbnail = await run_in_collage_executor(open_thumbnail, content, size)
+    if thumbnail is not None:
+        thumbnail_cache.set(key, thumbnail)
+    return thumbnail
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash: shrink to (hash_size + 1) x hash_size grayscale and set
+    one bit per pixel that is brighter than its right neighbour. Similar
+    images get hashes a few bits apart regardless of size or compression.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big")
+
+def hash_thumbnail(content: bytes) -> Optional[int]:
+    """
+    dHash of encoded image bytes, decoded at a small draft size.
+    Pure CPU work, safe to run in a worker process.
+    """
+    image = open_thumbnail(content, (64, 64))
+    return dhash(image) if image is not None else None
+
+def hash_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+async def get_thumbnail_hash(url: str, contents: Dict[str, bytes] = None) -> Optional[int]:
+    """
+    Return the perceptual hash of the image at `url`, cached by media
+    identity so a post is only hashed once. None if it cannot be downloaded.
+    Downloaded bytes are stored in `contents` when given.
+    """
+    key = media_cache_key(url)
+    cached = await thumbnail_hash_cache.get(key)
+    if cached is not None:
+        return cached
+    content = await download_image_bytes(url)
+    if content is None:
+        return None
+    if contents is not None:
+        contents[url] = content
+    image_hash = await run_in_collage_executor(hash_thumbnail, content)
+    if image_hash is not None:
+        await thumbnail_hash_cache.set(key, image_hash)
+    return image_hash
+
+async def select_distinct_thumbnails(
+    image_urls: List[str],
+    limit: int = 27,
+    max_distance: int = THUMBNAIL_HASH_DISTANCE,
+    contents: Dict[str, bytes] = None,
+) -> List[str]:
+    """
+    Pick up to `limit` thumbnails from `image_urls` (newest first), skipping
+    near-duplicates of thumbnails already picked and ones that cannot be
+    downloaded or hashed, and backfilling from the remaining URLs. Returns the first
+    `limit` URLs unchanged when THUMBNAIL_DEDUP is off.
+
+    If `contents` is given, the bytes downloaded for hashing are stored in it
+    for the selected URLs, so building collages need not download them again.
+    """
+    if not THUMBNAIL_DEDUP:
+        return image_urls[:limit]
+
+    selected, hashes, downloaded = [], [], {}
+    position = 0
+    with span("thumbnails.dedup", candidates=len(image_urls)) as dedup:
+        while len(selected) < limit and position < len(image_urls):
+            # Hash just enough candidates to fill the remaining slots, concurrently
+            batch = image_urls[position:position + limit - len(selected)]
+            position += len(batch)
+            hashed = await asyncio.gather(
+                *[get_thumbnail_hash(url, downloaded) for url in batch], return_exceptions=True
+            )
+            for url, image_hash in zip(batch, hashed):
+                if isinstance(image_hash, BaseException):
+                    # One bad thumbnail only costs its own slot, like a failed download
+                    logging.warning(f"Could not hash thumbnail {url}: {image_hash}")
+                    dedup.add("unavailable")
+                elif image_hash is None:
+                    dedup.add("unavailable")
+                elif any(hash_distance(image_hash, other) <= max_distance for other in hashes):
+                    dedup.add("duplicates")
+                else:
+                    selected.append(url)
+                    hashes.append(image_hash)
+        dedup.set(hashed=position, selected=len(selected))
+    if contents is not None:
+        contents.update({url: downloaded[url] for url in selected if url in downloaded})
+    return selected
+
+def compose_collage(images: List[Image.Image], width: int = 800, height: int = 1000, layout: Tuple = None) -> Image.Image:
+    """
+    Resize and paste decoded images into a single collage.
+    Pure CPU work, safe to run in a worker process.
     """
-    # Download all images
-    images = []
-    # Download images in parallel using asyncio.gather
-    downloaded_images = await asyncio.gather(*[download_image(url) for url in image_urls])
-    images = [img for img in downloaded_images if img is not None]
-    
     if not images:
         logging.error("No images could be downloaded. Check your URLs and internet connection.")
         raise Exception("No images could be downloaded. Check your URLs and internet connection.")
-    
+
     # Calculate layout if not provided
-    if layout is None:
-        n = len(images)
-        if n <= 2:
-            rows, cols = 1, n
-        elif n <= 4:
-            rows, cols = 2, 2
-        elif n <= 6:
-            rows, cols = 2, 3
-        elif n <= 9:
-            rows, cols = 3, 3
-        else:
-            # Calculate approximately square layout
-            import math
-            cols = math.ceil(math.sqrt(n))
-            rows = math.ceil(n / cols)
-    else:
-        rows, cols = layout
-    
+    rows, cols = layout if layout is not None else collage_layout(len(images))
+
     # Calculate dimensions for each image in the collage
     img_width = width // cols
     img_height = height // rows
-    
+
     # Create a new blank image for the collage
     collage = Image.new('RGB', (width, height), (255, 255, 255))
-    
+
     # Place each image in the collage
     for i, img in enumerate(images):
         if i >= rows * cols:
             break  # Don't try to place more images than our layout allows
-            
+
         # Resize image maintaining aspect ratio
         img_aspect = img.width / img.height
         cell_aspect = img_width / img_height
-        
+
         if img_aspect > cell_aspect:
             # Image is wider than cell
             new_width = img_width
@@ -79,16 +298,51 @@ async def create_collage_from_urls(image_urls:List[str], width:int=800, height:i
             new_width = int(new_height * img_aspect)
             offset_x = (img_width - new_width) // 2
             offset_y = 0
-            
+
         img_resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
+
         # Calculate position
         row = i // cols
         col = i % cols
         x = col * img_width + offset_x
         y = row * img_height + offset_y
-        
+
         # Paste the image into the collage
         collage.paste(img_resized, (x, y))
-    
-    return collage
\ No newline at end of file
+
+    return collage
+
+async def create_collage_from_urls(image_urls:List[str], width:int=800, height:int=1000, layout:Tuple=None, contents:Dict[str, bytes]=None)-> Image:
+    """
+    Creates a collage from a list of image URLs.
+
+    Parameters:
+    - image_urls: List of URLs to the images
+    - width: Width of the output collage
+    - height: Height of the output collage
+    - layout: Tuple indicating (rows, columns). If None, it will be calculated automatically.
+    - contents: Already downloaded image bytes by URL (see select_distinct_thumbnails)
+
+    Images are fetched through the download and thumbnail caches and decoded
+    at the cell size of the expected layout; decoding and compositing run in
+    the collage executor (see COLLAGE_EXECUTOR).
+    """
+    if not image_urls:
+        logging.error("No images could be downloaded. Check your URLs and internet connection.")
+        raise Exception("No images could be downloaded. Check your URLs and internet connection.")
+
+    rows, cols = layout if layout is not None else collage_layout(len(image_urls))
+    cell_size = (width // cols, height // rows)
+
+    with span("collage.build", image_count=len(image_urls)) as build:
+        # Download and decode images in parallel using asyncio.gather
+        thumbnails = await asyncio.gather(*[get_thumbnail(url, cell_size, (contents or {}).get(url)) for url in image_urls])
+        images = [img for img in thumbnails if img is not None]
+        build.set(images_decoded=len(images))
+
+        if not images:
+            logging.error("No images could be downloaded. Check your URLs and internet connection.")
+            raise Exception("No images could be downloaded. Check your URLs and internet connection.")
+
+        with span("collage.compose", images=len(images)):
+            return await run_in_collage_executor(compose_collage, images, width, height, layout)